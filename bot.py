@@ -1,37 +1,139 @@
+import io
 import os
+import tempfile
+import traceback
 import discord
+import requests
 from datetime import datetime
 from functools import partial
+import asyncio
 from asyncio import TimeoutError
-from multiprocessing import Process
+from multiprocessing import Process, get_context
 
-from discord.ext.commands import Bot
-from mojang_api import get_uuid, is_valid_uuid, get_username_history
+from discord.ext.commands import Bot, CommandInvokeError
+from mojang_api import is_valid_uuid
 
 from hivestats import hive_api as hive
-from hivestats.content_functions import get_next_rank
+from hivestats.analytics import RANK_BANDS, build_distributions
+from hivestats.circuit_breaker import CircuitBreaker, UpstreamUnavailable
+from hivestats.guilds import MAX_MEMBERS, GuildRegistry
+from hivestats.search import build_username_index
+from hivestats.scheduler import BACKGROUND, COMMAND, INTERACTIVE, Overloaded, Scheduler
+from hivestats.singleflight import SingleFlight, make_key
+from hivestats.sparklines import SparklineCache, render_trends
+from hivestats.traffic import TRAFFIC_SALT, TrafficRecorder
+from hivestats.watchlist import RULES, Subscription, Watchlist, diff_rows
+from hivestats.content_functions import get_next_rank, get_rank
+from hivestats.metrics import add_metrics
 from hivestats.database import Postgres
+from hivestats.export import export
+from hivestats.database.names import NameHistoryStore, query_all_names
+from hivestats.database.snapshot import LeaderboardCache
 import hivestats.database.leaderboard as db_lb
+import hivestats.database.watchlist as db_watchlist
 
 
 BOT_PREFIX = os.environ["BOT_PREFIX"]
 TOKEN = os.environ["DISCORD_TOKEN"]
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", 1))  # Number of bot processes
+SHARD_ID = os.environ.get("SHARD_ID")  # Shard of this process, set by the launcher
 
 
 BATCH_SIZE = 20  # Number of rows returned for commands that return a batch
 LEADERBOARD_LENGTH = 1000  # Number of players on the Hive leaderboard
+MAX_BATCH_PLAYERS = 10  # Max number of players accepted by batch commands
+
+MOJANG_BULK_URL = "https://api.mojang.com/profiles/minecraft"
+MOJANG_UUID_URL = "https://api.mojang.com/users/profiles/minecraft/{}".format
+MOJANG_HISTORY_URL = "https://api.mojang.com/user/profiles/{}/names".format
+MOJANG_BULK_SIZE = 10  # Max usernames resolvable per bulk mojang api call
+MOJANG_TIMEOUT = 5  # Seconds to wait for the mojang api before giving up
+
+SNAPSHOT_POLLING_FREQ = 30  # Frequency at which new leaderboard snapshots are checked
+MAX_WATCHED = 25  # Max number of subscriptions per channel
+PRERENDER_COUNT = 100  # Number of top players whose trends are rendered on refresh
+EXPORT_FORMATS = ("csv", "jsonl")  # Parquet needs pyarrow, which is not deployed
+
+COLUMNS_DICT = {  # Mapping of user facing column names to leaderboard columns
+    "wins": "victories",
+    "points": "total_points",
+    "elims": "total_eliminations",
+    "placings": "total_placing",
+    "played": "games_played",
+    "win%": "win_rate",
+    "placing%": "placing_rate",
+    "ppg": "points_per_game",
+}
 
 REACTION_TIMEOUT = 600  # Timeout for reaction based interfaces
 REACTION_POLLING_FREQ = 60  # Frequency at which reaction checks auto-timeout
+BUSY_MESSAGE = "The bot is busy right now, please try again in a moment."
+BUSY_TIMEOUT = 10  # Seconds after which busy replies to reactions are deleted
 
 
-client = Bot(command_prefix=BOT_PREFIX, case_insensitive=True)
+def fetch_uuid(username):
+    """Returns the uuid of a username from the Mojang api
+
+    Raises:
+        requests.RequestException: if the api failed to respond or had an error
+
+    Returns:
+        str or None: the uuid or None if no player has the username
+    """
+    r = requests.get(MOJANG_UUID_URL(username), timeout=MOJANG_TIMEOUT)
+
+    if r.status_code in (204, 400, 404):
+        return None
+
+    r.raise_for_status()
+    return r.json()["id"]
+
+
+def fetch_name_history(uuid):
+    """Returns the name history of a uuid from the Mojang api, oldest name first
+
+    Raises:
+        requests.RequestException: if the api failed to respond or had an error
+
+    Returns:
+        List[dict]: entries with name and changedToAt
+    """
+    r = requests.get(MOJANG_HISTORY_URL(uuid), timeout=MOJANG_TIMEOUT)
+    r.raise_for_status()
+
+    return r.json() if r.status_code == 200 else []
+
+
+client = Bot(
+    command_prefix=BOT_PREFIX,
+    case_insensitive=True,
+    **(
+        {"shard_id": int(SHARD_ID), "shard_count": SHARD_COUNT}
+        if SHARD_ID is not None
+        else {}
+    ),
+)
 database = Postgres()
+lb_cache = LeaderboardCache(db_lb.SNAPSHOTS, database, db_lb.load_snapshot)
+mojang = CircuitBreaker("The Mojang API", exceptions=(requests.RequestException,))
+name_store = NameHistoryStore(database, partial(mojang.call, fetch_name_history))
+lb_cache.register("distributions", build_distributions)
+lb_cache.register(  # Every known username, for lookups without the Mojang api
+    "usernames",
+    partial(build_username_index, load_history=partial(query_all_names, database)),
+)
+flights = SingleFlight()  # Shares work between identical concurrent commands
+scheduler = Scheduler()  # Admission control in front of all command handlers
+watchlist = Watchlist()  # Subscriptions of channels to players, indexed by uuid
+sparklines = SparklineCache()  # Trend charts shared by every shard on this host
+recorder = TrafficRecorder()  # Records traffic for hivestats.replay if enabled
+guilds = GuildRegistry(database, lb_cache)  # Players registered to each guild
 
 
 def run_bot():
     """Packaged function for multiprocessing, starts bot
     """
+    client.loop.create_task(poll_snapshots())
     client.run(TOKEN)
 
 
@@ -41,9 +143,142 @@ def update_leaderboard():
     db_lb.scheduled_update()
 
 
+async def poll_snapshots():
+    """Swaps in new leaderboard snapshots as soon as the updater publishes them so
+    that work derived from them is done outside of command handling
+    """
+    await client.wait_until_ready()
+
+    for row in db_watchlist.query_subscriptions(database):
+        watchlist.add(to_subscription(row))
+
+    version, rows = 0, None
+
+    while not client.is_closed():
+        try:
+            async with scheduler.slot(BACKGROUND):
+                lb_cache.refresh()
+
+                if lb_cache.version != version:
+                    version = lb_cache.version
+                    previous, rows = rows, lb_cache.rows("bp_all_view")
+
+                    # Nothing is sent for the first snapshot seen after startup
+                    if previous is not None and rows is not None:
+                        await notify_watchers(diff_rows(previous, rows))
+
+                    top = lb_cache.leaderboard("bp_all_view", 0, PRERENDER_COUNT)
+                    await load_trends([row["uuid"] for row in top or ()])
+        except Overloaded:
+            pass
+        except Exception:
+            # A failed poll must not stop every later snapshot from being swapped in
+            traceback.print_exc()
+
+        await asyncio.sleep(SNAPSHOT_POLLING_FREQ)
+
+
+def to_subscription(row):
+    """Converts a row of the watchlist table to a Subscription"""
+    return Subscription(row["channel_id"], row["uuid"], row["rule"], row["threshold"])
+
+
+async def load_trends(uuids):
+    """Returns the trend charts of players, rendering those not cached yet for the
+    current snapshot version
+
+    Args:
+        uuids (List[str]): ids of the players
+
+    Returns:
+        dict: mapping of uuid to a list of chart names and pngs
+    """
+    version = lb_cache.version
+    missing = sparklines.missing(uuids, version)
+
+    if missing:
+        history = db_lb.query_history(database, missing, sparklines.window)
+        # Rendering is pure python, so it is kept off the event loop
+        charts = await asyncio.get_event_loop().run_in_executor(
+            None, render_trends, history
+        )
+        sparklines.store(charts, version)
+
+    return {uuid: sparklines.charts(uuid, version) for uuid in uuids}
+
+
+async def notify_watchers(changes):
+    """Sends the notifications triggered by leaderboard changes, batched into as
+    few messages as possible per channel
+
+    Args:
+        changes (Iterable[Change]): changes between two snapshots
+    """
+    for channel_id, messages in watchlist.evaluate(changes).items():
+        # Channels of guilds handled by other shards are not visible here
+        channel = client.get_channel(channel_id)
+
+        if channel is None:
+            continue
+
+        for message in messages:
+            try:
+                await channel.send(message)
+            except discord.HTTPException:
+                break
+
+
+def guild_id(ctx):
+    """Returns the id of the guild a command was sent in, None for DMs"""
+    return ctx.guild.id if ctx.guild else None
+
+
+@client.before_invoke
+async def admit_command(ctx):
+    ctx.invocation = recorder.command(
+        ctx.command.qualified_name,
+        ctx.args[1:],
+        ctx.kwargs,
+        guild_id(ctx),
+        ctx.author.id,
+        ctx.channel.id,
+    )
+
+    try:
+        ctx.slot = await scheduler.acquire(COMMAND, guild_id(ctx), ctx.author.id)
+    except Overloaded as error:
+        raise CommandInvokeError(error) from error
+
+
+@client.after_invoke
+async def release_command(ctx):
+    ctx.slot.release()
+
+
+@client.event
+async def on_command_error(ctx, error):
+    error = getattr(error, "original", error)
+
+    if isinstance(error, Overloaded):
+        await ctx.send(BUSY_MESSAGE)
+        return
+
+    if isinstance(error, (UpstreamUnavailable, requests.RequestException)):
+        await ctx.send(
+            "The Hive or Mojang API is currently unavailable, please try again later."
+        )
+        return
+
+    raise error
+
+
 @client.event
 async def on_ready():
     print("Logged in as {}: {}".format(client.user.name, client.user.id))
+
+    if client.shard_count:
+        print("Running shard {} of {}".format(client.shard_id, client.shard_count))
+
     await client.change_presence(activity=discord.Game(name="The Hive"))
 
 
@@ -77,13 +312,169 @@ def resolve_username(username):
     if not username:
         return False, "Please provide a username."
 
-    if not is_valid_uuid(username):
+    if is_valid_uuid(username):
+        return True, username.replace("-", "")
+
+    uuid = confirmed_uuid(username)
+
+    if uuid is not None:
+        return True, uuid
+
+    try:
+        uuid = mojang.call(fetch_uuid, username)
+    except (UpstreamUnavailable, requests.RequestException):
+        return False, "The Mojang API is currently unavailable.{}".format(
+            did_you_mean(username)
+        )
+
+    if uuid is None:
+        return False, "Username or UUID was not found.{}".format(
+            did_you_mean(username)
+        )
+
+    return True, uuid
+
+
+def confirmed_uuid(username):
+    """Returns the uuid of a known player whose name history confirms they currently
+    use a username
+
+    Leaderboard usernames lag behind renames, so the username index only points to
+    candidates, which are checked against the stored name history of the player.
+
+    Args:
+        username (str): the username, case insensitive
+
+    Returns:
+        str or None: the uuid or None if no known player is confirmed to use it
+    """
+    indexed = lb_cache.derived("usernames").lookup(username)
+
+    if indexed is None:
+        return None
+
+    try:
+        current = name_store.current_name(indexed.uuid)
+    except (UpstreamUnavailable, requests.RequestException):
+        return None
+
+    if current is None or current.lower() != username.lower():
+        return None
+
+    return indexed.uuid
+
+
+def did_you_mean(username):
+    """Returns a hint listing known usernames similar to one that was not found
+
+    Args:
+        username (str): the username that was not found
+
+    Returns:
+        str: the hint or an empty string if no similar usernames are known
+    """
+    suggestions = lb_cache.derived("usernames").suggest(username)
+
+    if not suggestions:
+        return ""
+
+    return " Did you mean {}?".format(
+        ", ".join(f"**{format_username(entry.name)}**" for entry in suggestions)
+    )
+
+
+def resolve_usernames(usernames):
+    """Resolves several usernames to uuids using as few api calls as possible
+
+    Args:
+        usernames (Iterable[str]): usernames or uuids to be resolved
+
+    Returns:
+        dict: mapping of each given username to a tuple of its uuid and current
+              username, uuids are passed through without looking up the username
+              and usernames that could not be found map to None
+    """
+    resolved = {}
+    lookup = []
+
+    for username in usernames:
+        if is_valid_uuid(username):
+            resolved[username] = (username.replace("-", ""), None)
+        else:
+            lookup.append(username)
+
+    for i in range(0, len(lookup), MOJANG_BULK_SIZE):
+        batch = lookup[i : i + MOJANG_BULK_SIZE]
+
         try:
-            username = get_uuid(username).id
-        except AttributeError:
-            return False, "Username or UUID was not found."
+            r = mojang.call(
+                requests.post, MOJANG_BULK_URL, json=batch, timeout=MOJANG_TIMEOUT
+            )
+        except (UpstreamUnavailable, requests.RequestException):
+            # Players with a stored name history can still be found while offline
+            for username in batch:
+                uuid = confirmed_uuid(username)
+                resolved[username] = (uuid, None) if uuid else None
+
+            continue
+
+        profiles = {
+            profile["name"].lower(): (profile["id"], profile["name"])
+            for profile in (r.json() if r.ok else [])
+        }
+
+        for username in batch:
+            resolved[username] = profiles.get(username.lower())
+
+    return resolved
+
+
+def cached_stats(uuid, game="bp"):
+    """Returns the cached stats of a player for every period
+
+    Stats are read from the leaderboard snapshot shared by every shard, the
+    database is only queried while no snapshot has been loaded.
+
+    Args:
+        uuid (str): id of the player
+        game (str, optional): identifier for game, defaults to bp
+
+    Returns:
+        dict: mapping of period to stats, periods without stats for the player
+              are omitted
+    """
+    views = {period: f"{game}_{period}_view" for period in db_lb.PERIODS}
 
-    return True, username.replace("-", "")
+    if any(lb_cache.rows(view) is None for view in views.values()):
+        return db_lb.query_stats_periods(database, uuid, game)
+
+    stats = {period: lb_cache.player(view, uuid) for period, view in views.items()}
+
+    return {period: row for period, row in stats.items() if row is not None}
+
+
+def cached_stats_many(uuids, game="bp", period="all"):
+    """Returns the cached stats of several players for a period
+
+    Like cached_stats, the shared leaderboard snapshot is preferred over the
+    database.
+
+    Args:
+        uuids (Iterable[str]): ids of the players
+        game (str, optional): identifier for game, defaults to bp
+        period (str, optional): period of the stats, defaults to all time
+
+    Returns:
+        dict: mapping of uuid to stats for every player that has cached stats
+    """
+    view = f"{game}_{period}_view"
+
+    if lb_cache.rows(view) is None:
+        return db_lb.query_stats_many(database, uuids, game, period)
+
+    stats = {uuid: lb_cache.player(view, uuid) for uuid in uuids}
+
+    return {uuid: row for uuid, row in stats.items() if row is not None}
 
 
 def uuid_to_username(uuid):
@@ -98,7 +489,13 @@ def uuid_to_username(uuid):
     uuid = uuid.replace("-", "")
 
     if is_valid_uuid(uuid):
-        return format_username(get_username_history(uuid)[-1].name)
+        try:
+            username = name_store.current_name(uuid)
+        except (UpstreamUnavailable, requests.RequestException):
+            cached = lb_cache.player("bp_all_view", uuid)
+            username = cached["username"] if cached else uuid
+
+        return format_username(username) if username else None
 
     return None
 
@@ -115,6 +512,31 @@ def format_username(username):
     return username.replace("_", "\\_")
 
 
+def column_format(column):
+    """Returns the format spec used to display values of a leaderboard column
+
+    Args:
+        column (str): name of leaderboard column
+
+    Returns:
+        str: format spec for the column's values
+    """
+    if column in [
+        "victories",
+        "total_points",
+        "total_eliminations",
+        "total_placing",
+        "games_played",
+    ]:
+        return ","
+    elif column in ["win_rate", "placing_rate"]:
+        return ".2%"
+    elif column in ["points_per_game"]:
+        return ".2f"
+
+    return ""
+
+
 def format_interval(seconds, granularity=2):
     intervals = (
         ("years", 31536000),
@@ -140,18 +562,44 @@ def format_interval(seconds, granularity=2):
     return result[:granularity]
 
 
-def embed_header(data, head_size=64):
+def offline_header(uuid, username, head_size=64):
+    """Creates an embed header for when live player data is unavailable
+
+    Args:
+        uuid (str): id of player
+        username (str): already resolved username of the player
+        head_size (int, optional): width and height in pixels of thumbnail image
+                                   defaults to 64
+
+    Returns:
+        discord.Embed: an embed object formatted as required
+    """
+    embed = discord.Embed(
+        title="**{}**".format(username),
+        description="Live data is unavailable, showing cached stats",
+        color=0x222222,
+    )
+
+    embed.set_thumbnail(url=player_head(uuid, head_size))
+
+    return embed
+
+
+def embed_header(data, head_size=64, username=None):
     """Creates an embed with the primary fields filled in as required
 
     Args:
         data (dict): json data for player returned from hive api
         head_size (int, optional): width and heightin pixels of thumbnail image
                                    defaults to 64
+        username (str, optional): already resolved username of the player, looked
+                                  up from the uuid if not provided
 
     Returns:
         discord.Embed: an embed object formatted as required
     """
     current_time = int(datetime.timestamp(datetime.now()))
+    username = username or uuid_to_username(data["UUID"])
 
     if data["lastLogout"] < data["lastLogin"]:
         time_diff = current_time - data["lastLogin"]
@@ -167,9 +615,7 @@ def embed_header(data, head_size=64):
         color = 0x222222
 
     embed = discord.Embed(
-        title="**{}** - {}".format(
-            uuid_to_username(data["UUID"]), data["modernRank"]["human"]
-        ),
+        title="**{}** - {}".format(username, data["modernRank"]["human"]),
         description=description,
         color=color,
     )
@@ -198,24 +644,90 @@ async def seen(ctx, username):
     await ctx.send(embed=embed)
 
 
-@client.command(name="stats", aliases=["records", "stat"])
-async def get_stats(ctx, uuid=None, period="all", game="BP"):
+async def load_stats(uuid, game):
+    """Loads everything needed to render every period of a player's stats
+
+    Note:
+        results are shared between identical concurrent requests through
+        flights, so they must not be mutated
+
+    Args:
+        uuid (str or None): username or uuid of the player
+        game (str): identifier for game
+
+    Returns:
+        bool: whether the stats could be loaded
+        dict or str: the loaded data or error message
+    """
+    game = game.lower()
+
+    if game not in db_lb.GAMES:
+        return False, "Please use one of the following games: ```{}```".format(
+            ", ".join(db_lb.GAMES)
+        )
+
     valid, resolved = resolve_username(uuid)
 
     if not valid:
-        await ctx.send(resolved)
-        return
+        return False, resolved
 
     uuid = resolved
-    data = hive.player_data(uuid)
-    stats = hive.player_data(uuid, game)
+    loop = asyncio.get_event_loop()
+    period_stats = cached_stats(uuid, game)
+
+    try:
+        # The api calls are made concurrently, off the event loop
+        data, stats = await asyncio.gather(
+            loop.run_in_executor(None, hive.player_data, uuid),
+            loop.run_in_executor(None, hive.player_data, uuid, game),
+        )
+    except UpstreamUnavailable:
+        if "all" not in period_stats:
+            return (
+                False,
+                "The Hive API is currently unavailable, please try again later.",
+            )
 
-    if not data:
-        await ctx.send("This player has never played on The Hive.")
-        return
+        # Serve the cached stats instead, without live status
+        data = None
+        stats = dict(period_stats["all"])
+        stats["title"] = get_rank(stats["total_points"])
+    else:
+        if not data:
+            return False, "This player has never played on The Hive."
 
-    if not stats:
-        await ctx.send("This player has never played BlockParty.")
+        if not stats:
+            return False, "This player has never played BlockParty."
+
+    try:
+        next_rank, diff = await loop.run_in_executor(
+            None, get_next_rank, stats["total_points"]
+        )
+    except UpstreamUnavailable:
+        next_rank, diff = None, None
+
+    trends = (await load_trends([uuid]))[uuid]
+
+    return True, {
+        "uuid": uuid,
+        "username": uuid_to_username(uuid),
+        "data": data,
+        "stats": stats,
+        "period_stats": period_stats,
+        "next_rank": next_rank,
+        "diff": diff,
+        "trends": trends,
+    }
+
+
+@client.command(name="stats", aliases=["records", "stat"])
+async def get_stats(ctx, uuid=None, period="all", game="BP"):
+    valid, loaded = await flights.do(
+        make_key("stats", uuid, game), load_stats, uuid, game
+    )
+
+    if not valid:
+        await ctx.send(loaded)
         return
 
     reactions = {
@@ -225,12 +737,22 @@ async def get_stats(ctx, uuid=None, period="all", game="BP"):
         "\U0001F1E6": "all",
     }
 
-    def create_stats_embed(data, stats, uuid, game, period):
-        game = game.upper()
+    # Everything needed to render any period is loaded once up front so that
+    # switching periods is an in-memory re-render
+    uuid, username = loaded["uuid"], loaded["username"]
+    data, stats = loaded["data"], loaded["stats"]
+    period_stats = loaded["period_stats"]
+    next_rank, diff = loaded["next_rank"], loaded["diff"]
+
+    def create_stats_embed(period):
         period = period.lower()
 
-        embed = embed_header(data)
-        cached_stats = db_lb.query_stats(database, uuid, game, period)
+        if data:
+            embed = embed_header(data, username=username)
+        else:
+            embed = offline_header(uuid, username)
+
+        cached_stats = period_stats.get(period)
         if period != "all" and not cached_stats:
             embed.add_field(
                 name="BlockParty Stats",
@@ -238,37 +760,26 @@ async def get_stats(ctx, uuid=None, period="all", game="BP"):
             )
             return embed
         elif not cached_stats:
-            if stats["games_played"]:
-                win_rate = stats["victories"] / stats["games_played"]
-                placing_rate = stats["total_placing"] / stats["games_played"]
-                points_per_game = stats["total_points"] / stats["games_played"]
-            else:
-                win_rate, placing_rate, points_per_game = 0, 0, 0
-
-            cached_stats = {
-                "win_rate": win_rate,
-                "placing_rate": placing_rate,
-                "points_per_game": points_per_game,
-            }
+            cached_stats = add_metrics(dict(stats))
 
-        stats.update(cached_stats)
+        shown = dict(stats)
+        shown.update(cached_stats)
 
-        if stats["games_played"] == 0:
+        if shown["games_played"] == 0:
             win_loss = "Undefined"
-        elif stats["win_rate"] == 1:
+        elif shown["win_rate"] == 1:
             win_loss = "Infinity"
         else:
-            win_loss = "{:.2f}".format(stats["win_rate"] / (1 - stats["win_rate"]))
+            win_loss = "{:.2f}".format(shown["win_rate"] / (1 - shown["win_rate"]))
 
-        next_rank, diff = get_next_rank(stats["total_points"])
         next_rank_text = (
             f"**Next Rank:** {next_rank} ({diff:,} points away)\n"
-            if period == "all"
+            if period == "all" and next_rank
             else ""
         )
         leaderboard_text = (
-            f"**Leaderboard #**: {stats['position']}\n"
-            if "position" in cached_stats
+            f"**Leaderboard #**: {shown['position']}\n"
+            if "position" in shown
             else ""
         )
 
@@ -279,12 +790,12 @@ async def get_stats(ctx, uuid=None, period="all", game="BP"):
         embed.add_field(
             name=embed_title,
             value=(
-                f"**Rank:** {stats['title']}\n"
-                f"**Points:** {stats['total_points']:,}\n"
-                f"**Games Played:** {stats['games_played']:,}\n"
-                f"**Wins:** {stats['victories']:,}\n"
-                f"**Placings:** {stats['total_placing']:,}\n"
-                f"**Eliminations:** {stats['total_eliminations']:,}\n"
+                f"**Rank:** {shown['title']}\n"
+                f"**Points:** {shown['total_points']:,}\n"
+                f"**Games Played:** {shown['games_played']:,}\n"
+                f"**Wins:** {shown['victories']:,}\n"
+                f"**Placings:** {shown['total_placing']:,}\n"
+                f"**Eliminations:** {shown['total_eliminations']:,}\n"
             ),
         )
         embed.add_field(
@@ -293,16 +804,32 @@ async def get_stats(ctx, uuid=None, period="all", game="BP"):
                 f"{next_rank_text}"
                 f"{leaderboard_text}"
                 f"**W/L Ratio:** {win_loss}\n"
-                f"**Win Rate:** {stats['win_rate']:.2%}\n"
-                f"**Placing Rate:** {stats['placing_rate']:.2%}\n"
-                f"**Points per Game**: {stats['points_per_game']:.2f}\n"
+                f"**Win Rate:** {shown['win_rate']:.2%}\n"
+                f"**Placing Rate:** {shown['placing_rate']:.2%}\n"
+                f"**Points per Game**: {shown['points_per_game']:.2f}\n"
             ),
         )
-        embed.set_footer(text="D: Daily, W: Weekly, M: Monthly, A: All-time")
+        footer = "D: Daily, W: Weekly, M: Monthly, A: All-time"
+
+        if loaded["trends"]:
+            footer += "\nCharts: {} over the last {} days".format(
+                ", ".join(metric.replace("_", " ") for metric, _ in loaded["trends"]),
+                sparklines.window,
+            )
+
+        embed.set_footer(text=footer)
 
         return embed
 
-    msg = await ctx.send(embed=create_stats_embed(data, stats, uuid, game, period))
+    # Trends cover the last days regardless of period, so they are only sent once
+    files = [
+        discord.File(io.BytesIO(chart), filename=f"{metric}.png")
+        for metric, chart in loaded["trends"]
+    ]
+
+    msg = await ctx.send(embed=create_stats_embed(period), files=files or None)
+    # Waiting on reactions does not hold on to the command's slot
+    ctx.slot.release()
 
     if str(ctx.channel.type) != "text":
         await ctx.send("Warning: The emojis are not auto removed in DMs.")
@@ -325,10 +852,17 @@ async def get_stats(ctx, uuid=None, period="all", game="BP"):
                 and payload.user_id == ctx.author.id
                 and emoji in reactions
             ):
+                recorder.reaction(ctx.invocation, emoji)
+
                 stats_type = reactions[emoji]
-                await msg.edit(
-                    embed=create_stats_embed(data, stats, uuid, game, stats_type)
-                )
+
+                try:
+                    async with scheduler.slot(
+                        INTERACTIVE, guild_id(ctx), ctx.author.id
+                    ):
+                        await msg.edit(embed=create_stats_embed(stats_type))
+                except Overloaded:
+                    await ctx.send(BUSY_MESSAGE, delete_after=BUSY_TIMEOUT)
 
                 if str(ctx.channel.type) == "text":
                     await msg.remove_reaction(emoji, ctx.author)
@@ -339,6 +873,88 @@ async def get_stats(ctx, uuid=None, period="all", game="BP"):
     await msg.clear_reactions()
 
 
+@client.command(name="batchstats", aliases=["teamstats", "bstats"])
+async def batch_stats(ctx, *usernames):
+    period = "all"
+
+    if usernames and usernames[0].lower() in db_lb.PERIODS:
+        period, usernames = usernames[0].lower(), usernames[1:]
+
+    if not usernames:
+        await ctx.send("Please provide at least one username.")
+        return
+
+    if len(usernames) > MAX_BATCH_PLAYERS:
+        await ctx.send("Please provide at most {} usernames.".format(MAX_BATCH_PLAYERS))
+        return
+
+    resolved = resolve_usernames(usernames)
+    not_found = [name for name, profile in resolved.items() if not profile]
+    names = {uuid: name for uuid, name in filter(None, resolved.values())}
+
+    rows = cached_stats_many(names, period=period)
+
+    # Players outside of the cached leaderboard only have all-time stats
+    if period == "all":
+        missing = [uuid for uuid in names if uuid not in rows]
+
+        try:
+            fetched = hive.player_data_many(missing, "BP")
+        except UpstreamUnavailable:
+            fetched = {}
+
+        for uuid, stats in fetched.items():
+            if stats:
+                rows[uuid] = add_metrics(dict(stats, uuid=uuid, position=None))
+
+    for uuid in names:
+        if uuid not in rows:
+            not_found.append(names[uuid] or uuid_to_username(uuid) or uuid)
+
+    if not rows:
+        await ctx.send("None of these players have stats available for this period.")
+        return
+
+    rows = sorted(rows.values(), key=lambda row: row["total_points"], reverse=True)
+    players = []
+
+    for row in rows:
+        username = row.get("username") or names[row["uuid"]]
+
+        if username:
+            username = format_username(username)
+        else:
+            username = uuid_to_username(row["uuid"])
+
+        position = f"#{row['position']}" if row["position"] else "-"
+        players.append(f"**{username}** ({position})")
+
+    if period != "all":
+        embed_title = f"BlockParty {period.capitalize()} Stats"
+    else:
+        embed_title = "BlockParty Stats"
+
+    embed = discord.Embed(title=embed_title, color=0xFFA500)
+    embed.add_field(name="Player (#)", value="\n".join(players))
+    embed.add_field(
+        name="Points (Games)",
+        value="\n".join(
+            f"{row['total_points']:,} ({row['games_played']:,})" for row in rows
+        ),
+    )
+    embed.add_field(
+        name="Win Rate / PPG",
+        value="\n".join(
+            f"{row['win_rate']:.2%} / {row['points_per_game']:.2f}" for row in rows
+        ),
+    )
+
+    if not_found:
+        embed.set_footer(text="No stats found for: {}".format(", ".join(not_found)))
+
+    await ctx.send(embed=embed)
+
+
 @client.command(name="names", aliases=["history", "namemc"])
 async def get_names(ctx, uuid=None, count: int = None):
     if count and count <= 0:
@@ -352,60 +968,124 @@ async def get_names(ctx, uuid=None, count: int = None):
         return
 
     uuid = resolved
-    response = get_username_history(uuid)
-    count = len(response) if count is None else count
-
-    names = [format_username(entry.name) for entry in response[::-1]]
-    # Java timestamps are returned which are in millisecs, so we divide by 1000
-    times = [
-        datetime.fromtimestamp(entry.changedToAt / 1000).strftime("%d %b, %Y %H:%M")
-        for entry in response[:0:-1]
-    ]
-    times.append("(Original Name)")
+    history = name_store.history(uuid)
 
-    # Trim down lists to requested size
-    names, times = names[:count], times[:count]
+    if not history:
+        await ctx.send("Username or UUID was not found.")
+        return
 
-    embed = discord.Embed(
-        title="**{}'s Name History**".format(names[0]), color=0xFFA500
-    )
+    count = len(history) if count is None else min(count, len(history))
+    pages = -(-count // BATCH_SIZE)
+    reactions = {
+        "\u25C0": -1,  # left_arrow
+        "\u25B6": 1,  # right_arrow
+    }
 
-    embed.set_thumbnail(url=player_head(uuid, 64))
+    def create_names_embed(page):
+        lines = []
+
+        # Only the entries on the requested page are formatted
+        for entry in history[page * BATCH_SIZE : min((page + 1) * BATCH_SIZE, count)]:
+            if entry.changed_at:
+                # Java timestamps are stored which are in millisecs, so divide by 1000
+                time = datetime.fromtimestamp(entry.changed_at / 1000).strftime(
+                    "%d %b, %Y %H:%M"
+                )
+            else:
+                time = "(Original Name)"
 
-    batch_size = 20
+            lines.append("**{}** - {}".format(format_username(entry.name), time))
 
-    for i in range(0, len(names), batch_size):
-        embed.add_field(
-            name="\u200b",
-            value="\n".join(
-                [
-                    "**{}** - {}".format(name, time)
-                    for name, time in zip(
-                        names[i : i + batch_size], times[i : i + batch_size]
-                    )
-                ]
-            ),
-            inline=False,
+        embed = discord.Embed(
+            title="**{}'s Name History**".format(format_username(history[0].name)),
+            color=0xFFA500,
         )
 
-    await ctx.send(embed=embed)
+        embed.set_thumbnail(url=player_head(uuid, 64))
+        embed.add_field(name="\u200b", value="\n".join(lines), inline=False)
 
+        if pages > 1:
+            embed.set_footer(text=f"Current page: {page + 1}/{pages}")
 
-@client.command(name="compare")
-async def compare(ctx, uuid_a=None, uuid_b=None, game="BP"):
-    resolved_uuids = []
+        return embed
 
-    for i, uuid in enumerate([uuid_a, uuid_b]):
-        valid, resolved = resolve_username(uuid)
+    page = 0
+    msg = await ctx.send(embed=create_names_embed(page))
 
-        if not valid:
-            await ctx.send(resolved)
+    if pages == 1:
+        return
+
+    # Waiting on reactions does not hold on to the command's slot
+    ctx.slot.release()
+
+    for reaction in reactions:
+        await msg.add_reaction(reaction)
+
+    if str(msg.channel.type) != "text":
+        await ctx.send("Warning: The emojis are not auto removed in DMs.")
+
+    async def run_checks(page):
+        try:
+            payload = await client.wait_for(
+                "raw_reaction_add", timeout=REACTION_POLLING_FREQ
+            )
+        except TimeoutError:
+            pass
+        else:
+            emoji = str(payload.emoji.name)
+
+            if (
+                payload.message_id == msg.id
+                and payload.user_id == ctx.author.id
+                and emoji in reactions
+            ):
+                recorder.reaction(ctx.invocation, emoji)
+
+                if str(msg.channel.type) == "text":
+                    await msg.remove_reaction(emoji, ctx.author)
+
+                try:
+                    async with scheduler.slot(
+                        INTERACTIVE, guild_id(ctx), ctx.author.id
+                    ):
+                        new_page = (page + reactions[emoji]) % pages
+                        await msg.edit(embed=create_names_embed(new_page))
+                except Overloaded:
+                    await ctx.send(BUSY_MESSAGE, delete_after=BUSY_TIMEOUT)
+                else:
+                    page = new_page
+
+        return page
+
+    while (datetime.utcnow() - msg.created_at).total_seconds() < REACTION_TIMEOUT:
+        page = await run_checks(page)
+
+    await msg.clear_reactions()
+
+
+@client.command(name="compare")
+async def compare(ctx, uuid_a=None, uuid_b=None, game="BP"):
+    resolved_uuids = []
+
+    for i, uuid in enumerate([uuid_a, uuid_b]):
+        valid, resolved = resolve_username(uuid)
+
+        if not valid:
+            await ctx.send(resolved)
             return
 
         resolved_uuids.append(resolved)
 
     get_stats = partial(hive.player_data, game=game)
-    stats = [get_stats(resolved_uuids[0]), get_stats(resolved_uuids[1])]
+
+    try:
+        stats = [get_stats(resolved_uuids[0]), get_stats(resolved_uuids[1])]
+    except UpstreamUnavailable:
+        # Fall back to the cached all-time stats of both players
+        cached = cached_stats_many(resolved_uuids)
+        stats = [
+            dict(cached[uuid]) if uuid in cached else None for uuid in resolved_uuids
+        ]
 
     for uuid, stat in zip(resolved_uuids, stats):
         if not stat:
@@ -415,9 +1095,7 @@ async def compare(ctx, uuid_a=None, uuid_b=None, game="BP"):
             return
 
         stat["username"] = uuid_to_username(uuid)
-        stat["win_rate"] = stat["victories"] / stat["games_played"]
-        stat["placing_rate"] = stat["total_placing"] / stat["games_played"]
-        stat["points_per_game"] = stat["total_points"] / stat["games_played"]
+        add_metrics(stat, game)
 
     embed = discord.Embed(
         title="{} and {} Stats Comparison".format(
@@ -480,18 +1158,31 @@ async def compare(ctx, uuid_a=None, uuid_b=None, game="BP"):
     await ctx.send(embed=embed)
 
 
+def leaderboard_page(period, column, page):
+    """Returns a page of a cached leaderboard
+
+    Args:
+        period (str): period of the leaderboard
+        column (str): column to sort the leaderboard by
+        page (int): 0 based page number
+
+    Returns:
+        Tuple(dict): leaderboard entries on the page
+    """
+    data = lb_cache.leaderboard(
+        f"bp_{period}_view", BATCH_SIZE * page, BATCH_SIZE, sort_by=column
+    )
+
+    if data is None:
+        data = db_lb.query_leaderboard(
+            database, BATCH_SIZE * page, BATCH_SIZE, sort_by=column, period=period
+        )
+
+    return data
+
+
 @client.command(name="leaderboard", aliases=["leaderboards", "lb"])
 async def leaderboard(ctx, period="all", column="points", page=1, game="BP"):
-    columns_dict = {
-        "wins": "victories",
-        "points": "total_points",
-        "elims": "total_eliminations",
-        "placings": "total_placing",
-        "played": "games_played",
-        "win%": "win_rate",
-        "placing%": "placing_rate",
-        "ppg": "points_per_game",
-    }
     valid_periods = ["all", "monthly", "weekly", "daily"]
     usage = "**Invalid Parameters: ** Expected /lb [period] [column] [page]\n"
 
@@ -503,10 +1194,10 @@ async def leaderboard(ctx, period="all", column="points", page=1, game="BP"):
         )
         return
 
-    if column not in columns_dict:
+    if column not in COLUMNS_DICT:
         await ctx.send(
             "{}Please use one of the following columns: ```{}```".format(
-                usage, ", ".join(columns_dict.keys())
+                usage, ", ".join(COLUMNS_DICT.keys())
             )
         )
         return
@@ -515,7 +1206,7 @@ async def leaderboard(ctx, period="all", column="points", page=1, game="BP"):
         await ctx.send("Please input a page number between 1-50.")
         return
 
-    column = columns_dict[column]
+    column = COLUMNS_DICT[column]
     page -= 1
     reactions = {
         "\u23EA": -10,  # rewind
@@ -524,28 +1215,15 @@ async def leaderboard(ctx, period="all", column="points", page=1, game="BP"):
         "\u23E9": 10,  # fast_forward
     }
 
-    def create_lb_embed(page, game, period):
+    async def create_lb_embed(page, game, period):
         game = game.upper()
         period = period.lower()
 
-        data = db_lb.query_leaderboard(
-            database, BATCH_SIZE * page, BATCH_SIZE, sort_by=column, period=period
+        data = await flights.do(
+            make_key("lb", period, column, page), leaderboard_page, period, column, page
         )
 
-        if column in [
-            "victories",
-            "total_points",
-            "total_eliminations",
-            "total_placing",
-            "games_played",
-        ]:
-            format_string = ","
-        elif column in ["win_rate", "placing_rate"]:
-            format_string = ".2%"
-        elif column in ["points_per_game"]:
-            format_string = ".2f"
-        else:
-            format_string = ""
+        format_string = column_format(column)
 
         if period != "all":
             embed_title = f"BlockParty {period.capitalize()} Leaderboard"
@@ -571,13 +1249,15 @@ async def leaderboard(ctx, period="all", column="points", page=1, game="BP"):
         )
         return embed, True
 
-    result, success = create_lb_embed(page, game, period)
+    result, success = await create_lb_embed(page, game, period)
 
     if not success:
         await ctx.send(result)
         return
 
     msg = await ctx.send(embed=result)
+    # Waiting on reactions does not hold on to the command's slot
+    ctx.slot.release()
 
     for reaction in reactions:
         await msg.add_reaction(reaction)
@@ -600,14 +1280,24 @@ async def leaderboard(ctx, period="all", column="points", page=1, game="BP"):
                 and payload.user_id == ctx.author.id
                 and emoji in reactions
             ):
+                recorder.reaction(ctx.invocation, emoji)
+
                 if str(msg.channel.type) == "text":
                     await msg.remove_reaction(emoji, ctx.author)
 
-                page += reactions[emoji]
-                page %= int(LEADERBOARD_LENGTH / BATCH_SIZE)
+                new_page = page + reactions[emoji]
+                new_page %= int(LEADERBOARD_LENGTH / BATCH_SIZE)
 
-                result, _ = create_lb_embed(page, game, period)
-                await msg.edit(embed=result)
+                try:
+                    async with scheduler.slot(
+                        INTERACTIVE, guild_id(ctx), ctx.author.id
+                    ):
+                        result, _ = await create_lb_embed(new_page, game, period)
+                        await msg.edit(embed=result)
+                except Overloaded:
+                    await ctx.send(BUSY_MESSAGE, delete_after=BUSY_TIMEOUT)
+                else:
+                    page = new_page
 
         return page
 
@@ -617,6 +1307,443 @@ async def leaderboard(ctx, period="all", column="points", page=1, game="BP"):
     await msg.clear_reactions()
 
 
+@client.command(name="register")
+async def register(ctx, uuid=None):
+    if not ctx.guild:
+        await ctx.send("Players can only be registered to a server.")
+        return
+
+    valid, resolved = resolve_username(uuid)
+
+    if not valid:
+        await ctx.send(resolved)
+        return
+
+    uuid = resolved
+
+    if len(guilds.members(ctx.guild.id)) >= MAX_MEMBERS:
+        await ctx.send(f"A server can have at most {MAX_MEMBERS} registered players.")
+        return
+
+    if not guilds.register(ctx.guild.id, uuid):
+        await ctx.send("This player is already registered to this server.")
+        return
+
+    await ctx.send(
+        "**{}** is now registered to this server.".format(uuid_to_username(uuid))
+    )
+
+
+@client.command(name="unregister")
+async def unregister(ctx, uuid=None):
+    if not ctx.guild:
+        await ctx.send("Players can only be registered to a server.")
+        return
+
+    valid, resolved = resolve_username(uuid)
+
+    if not valid:
+        await ctx.send(resolved)
+        return
+
+    uuid = resolved
+
+    if not guilds.unregister(ctx.guild.id, uuid):
+        await ctx.send("This player is not registered to this server.")
+        return
+
+    await ctx.send(
+        "**{}** is no longer registered to this server.".format(uuid_to_username(uuid))
+    )
+
+
+@client.command(name="serverlb", aliases=["guildlb", "slb"])
+async def server_leaderboard(ctx, period="all", column="points", page=1):
+    if not ctx.guild:
+        await ctx.send("Server leaderboards can only be used in a server.")
+        return
+
+    if period not in db_lb.PERIODS:
+        await ctx.send(
+            "Please use one of the following periods: ```{}```".format(
+                ", ".join(db_lb.PERIODS)
+            )
+        )
+        return
+
+    if column not in COLUMNS_DICT:
+        await ctx.send(
+            "Please use one of the following columns: ```{}```".format(
+                ", ".join(COLUMNS_DICT.keys())
+            )
+        )
+        return
+
+    if not isinstance(page, int) or page < 1:
+        await ctx.send("Please input a page number of at least 1.")
+        return
+
+    column = COLUMNS_DICT[column]
+    data = guilds.leaderboard(
+        ctx.guild.id, BATCH_SIZE * (page - 1), BATCH_SIZE, column, period
+    )
+
+    if not data:
+        await ctx.send(
+            "No registered players have stats on this page, players can be "
+            f"registered with {BOT_PREFIX}register."
+        )
+        return
+
+    format_string = column_format(column)
+    pages = -(-guilds.count(ctx.guild.id, period) // BATCH_SIZE)
+
+    if period != "all":
+        embed_title = f"{ctx.guild.name} {period.capitalize()} Leaderboard"
+    else:
+        embed_title = f"{ctx.guild.name} Leaderboard"
+
+    embed = discord.Embed(title=embed_title, color=0xFFA500)
+    embed.set_footer(text=f"Page {page} of {max(pages, page)}")
+    embed.add_field(
+        name="#    Player",
+        value="\n".join(
+            [
+                f"{entry['row_num']}) **{format_username(entry['username'])}**"
+                for entry in data
+            ]
+        ),
+    )
+    embed.add_field(
+        name=column.replace("_", " ").capitalize(),
+        value="\n".join([f"{entry[column]:{format_string}}" for entry in data]),
+    )
+
+    await ctx.send(embed=embed)
+
+
+@client.command(name="percentile", aliases=["pct"])
+async def percentile(ctx, uuid=None, column="points", period="all"):
+    if column not in COLUMNS_DICT:
+        await ctx.send(
+            "Please use one of the following columns: ```{}```".format(
+                ", ".join(COLUMNS_DICT.keys())
+            )
+        )
+        return
+
+    if period not in db_lb.PERIODS:
+        await ctx.send(
+            "Please use one of the following periods: ```{}```".format(
+                ", ".join(db_lb.PERIODS)
+            )
+        )
+        return
+
+    valid, resolved = resolve_username(uuid)
+
+    if not valid:
+        await ctx.send(resolved)
+        return
+
+    uuid = resolved
+    column = COLUMNS_DICT[column]
+    view = f"bp_{period}_view"
+    distribution = lb_cache.derived("distributions").get((view, column))
+
+    if not distribution:
+        await ctx.send("Leaderboard data is not available yet, please try again later.")
+        return
+
+    stats = lb_cache.player(view, uuid)
+
+    # Players outside of the cached leaderboard only have all-time stats
+    if not stats and period == "all":
+        stats = hive.player_data(uuid, "BP")
+        stats = add_metrics(stats) if stats else None
+
+    if not stats:
+        await ctx.send("This player does not have any stats available for this period.")
+        return
+
+    value = stats[column] if isinstance(stats[column], int) else float(stats[column])
+    band = distribution.band(value)
+    format_string = column_format(column)
+    mean_format = ",.1f" if format_string == "," else format_string
+    top_mean = distribution.top_mean(RANK_BANDS[3])
+
+    embed = discord.Embed(
+        title="**{}** - {}".format(
+            uuid_to_username(uuid), column.replace("_", " ").capitalize()
+        ),
+        description=(
+            f"**Value:** {value:{format_string}}\n"
+            f"**Rank:** #{distribution.rank(value):,} of {distribution.count:,}\n"
+            f"**Percentile:** {distribution.percentile(value):.1%}\n"
+            f"**Band:** {f'Top {band:,}' if band else 'Outside the leaderboard'}\n"
+            f"**Top {RANK_BANDS[3]} Average:** {top_mean:{mean_format}}\n"
+        ),
+        color=0xFFA500,
+    )
+    embed.set_thumbnail(url=player_head(uuid, 64))
+    embed.set_footer(text="Compared against the cached BlockParty leaderboard")
+
+    await ctx.send(embed=embed)
+
+
+@client.command(name="summary", aliases=["distribution"])
+async def summary(ctx, column="points", period="all"):
+    if column not in COLUMNS_DICT:
+        await ctx.send(
+            "Please use one of the following columns: ```{}```".format(
+                ", ".join(COLUMNS_DICT.keys())
+            )
+        )
+        return
+
+    if period not in db_lb.PERIODS:
+        await ctx.send(
+            "Please use one of the following periods: ```{}```".format(
+                ", ".join(db_lb.PERIODS)
+            )
+        )
+        return
+
+    column = COLUMNS_DICT[column]
+    distribution = lb_cache.derived("distributions").get((f"bp_{period}_view", column))
+
+    if not distribution or not distribution.count:
+        await ctx.send("Leaderboard data is not available yet, please try again later.")
+        return
+
+    stats = distribution.summary()
+    format_string = column_format(column)
+    mean_format = ",.1f" if format_string == "," else format_string
+
+    if period != "all":
+        embed_title = f"BlockParty {period.capitalize()} Summary"
+    else:
+        embed_title = "BlockParty Summary"
+
+    embed = discord.Embed(
+        title=f"{embed_title} - {column.replace('_', ' ').capitalize()}",
+        color=0xFFA500,
+    )
+    embed.add_field(
+        name="Distribution",
+        value=(
+            f"**Players:** {stats['count']:,}\n"
+            f"**Min:** {stats['min']:{format_string}}\n"
+            f"**Median:** {stats['median']:{format_string}}\n"
+            f"**90th Percentile:** {stats['p90']:{format_string}}\n"
+            f"**99th Percentile:** {stats['p99']:{format_string}}\n"
+            f"**Max:** {stats['max']:{format_string}}\n"
+        ),
+    )
+    embed.add_field(
+        name="Averages",
+        value="\n".join(
+            [
+                f"**Mean:** {stats['mean']:{mean_format}}",
+                f"**Std Dev:** {stats['stdev']:{mean_format}}",
+            ]
+            + [
+                f"**Top {band:,}:** {distribution.top_mean(band):{mean_format}}"
+                for band in RANK_BANDS[1:]
+                if band <= distribution.count
+            ]
+        ),
+    )
+
+    await ctx.send(embed=embed)
+
+
+@client.command(name="export")
+async def export_leaderboard(ctx, period="all", column="points", fmt="csv"):
+    if period not in db_lb.PERIODS:
+        await ctx.send(
+            "Please use one of the following periods: ```{}```".format(
+                ", ".join(db_lb.PERIODS)
+            )
+        )
+        return
+
+    if column not in COLUMNS_DICT:
+        await ctx.send(
+            "Please use one of the following columns: ```{}```".format(
+                ", ".join(COLUMNS_DICT.keys())
+            )
+        )
+        return
+
+    if fmt not in EXPORT_FORMATS:
+        await ctx.send(
+            "Please use one of the following formats: ```{}```".format(
+                ", ".join(EXPORT_FORMATS)
+            )
+        )
+        return
+
+    filename = f"bp_{period}_{column.replace('%', '_rate')}.{fmt}"
+
+    # Exports are streamed to disk so the rows are never all held in memory
+    with tempfile.TemporaryFile() as file:
+        export(database, file, fmt, period=period, sort_by=COLUMNS_DICT[column])
+        file.seek(0)
+        await ctx.send(file=discord.File(file, filename=filename))
+
+
+@client.command(name="search", aliases=["find"])
+async def search(ctx, name=None):
+    if not name:
+        await ctx.send("Please provide the start of a username.")
+        return
+
+    index = lb_cache.derived("usernames")
+    matches = index.complete(name, BATCH_SIZE) or index.suggest(name, BATCH_SIZE)
+
+    if not matches:
+        await ctx.send("No known players have a similar username.")
+        return
+
+    lines = [
+        "**{}**{}".format(
+            format_username(entry.name), "" if entry.current else " (old name)"
+        )
+        for entry in matches
+    ]
+
+    embed = discord.Embed(
+        title=f"Players matching {format_username(name)}",
+        description="\n".join(lines),
+        color=0xFFA500,
+    )
+    embed.set_footer(
+        text="Only players seen on the leaderboards or looked up before are known"
+    )
+
+    await ctx.send(embed=embed)
+
+
+@client.command(name="watch")
+async def watch(ctx, uuid=None, rule="positions", threshold: int = 1):
+    if not ctx.guild:
+        await ctx.send("Players can only be watched from a server channel.")
+        return
+
+    if rule not in RULES:
+        await ctx.send(
+            "Please use one of the following rules: ```{}```".format(
+                ", ".join(RULES.keys())
+            )
+        )
+        return
+
+    valid, resolved = resolve_username(uuid)
+
+    if not valid:
+        await ctx.send(resolved)
+        return
+
+    uuid = resolved
+    subscriptions = watchlist.channel(ctx.channel.id)
+
+    if len(subscriptions) >= MAX_WATCHED and not any(
+        subscription.uuid == uuid and subscription.rule == rule
+        for subscription in subscriptions
+    ):
+        await ctx.send(f"A channel can have at most {MAX_WATCHED} subscriptions.")
+        return
+
+    db_watchlist.add_subscription(database, ctx.channel.id, uuid, rule, threshold)
+    watchlist.add(Subscription(ctx.channel.id, uuid, rule, threshold))
+
+    await ctx.send(
+        "This channel is now watching **{}** ({}).".format(
+            uuid_to_username(uuid), rule
+        )
+    )
+
+
+@client.command(name="unwatch")
+async def unwatch(ctx, uuid=None, rule=None):
+    if rule is not None and rule not in RULES:
+        await ctx.send(
+            "Please use one of the following rules: ```{}```".format(
+                ", ".join(RULES.keys())
+            )
+        )
+        return
+
+    valid, resolved = resolve_username(uuid)
+
+    if not valid:
+        await ctx.send(resolved)
+        return
+
+    uuid = resolved
+    removed = db_watchlist.remove_subscriptions(database, ctx.channel.id, uuid, rule)
+    watchlist.remove(ctx.channel.id, uuid, rule)
+
+    if not removed:
+        await ctx.send("This channel is not watching that player.")
+        return
+
+    await ctx.send(
+        "This channel is no longer watching **{}**.".format(
+            uuid_to_username(uuid)
+        )
+    )
+
+
+@client.command(name="watchlist", aliases=["watching"])
+async def show_watchlist(ctx):
+    subscriptions = watchlist.channel(ctx.channel.id)
+
+    if not subscriptions:
+        await ctx.send("This channel is not watching any players.")
+        return
+
+    lines = [
+        "**{}** - {}{}".format(
+            uuid_to_username(subscription.uuid),
+            subscription.rule,
+            f" ({subscription.threshold:,})"
+            if subscription.rule == "positions"
+            else "",
+        )
+        for subscription in sorted(subscriptions)
+    ]
+
+    embed = discord.Embed(
+        title="Watchlist", description="\n".join(lines), color=0xFFA500
+    )
+    await ctx.send(embed=embed)
+
+
 if __name__ == "__main__":
-    Process(target=run_bot).start()
+    # The snapshot left over from a previous run is not served before the updater
+    # publishes a fresh one
+    db_lb.SNAPSHOTS.reset()
+
+    if SHARD_COUNT > 1:
+        # Shards are spawned rather than forked so that each process imports the bot
+        # with its own SHARD_ID and builds its client for that shard. They share the
+        # single updater below and read leaderboards and cached stats from its
+        # snapshots. Each shard still has its own database connection and api
+        # circuit breakers for name histories, watchlists and live stats
+        spawn = get_context("spawn")
+
+        # Spawned shards import the traffic module afresh, so they are given the
+        # salt of this process to anonymise ids the same way
+        os.environ["TRAFFIC_SALT"] = TRAFFIC_SALT
+
+        for shard_id in range(SHARD_COUNT):
+            os.environ["SHARD_ID"] = str(shard_id)
+            spawn.Process(target=run_bot).start()
+
+        del os.environ["SHARD_ID"]
+    else:
+        Process(target=run_bot).start()
+
     Process(target=update_leaderboard).start()
@@ -0,0 +1,146 @@
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from math import sqrt
+
+RANK_BANDS = (1, 10, 50, 100, 250, 500, 1000)  # Bands players are grouped into
+ANALYTICS_COLUMNS = (  # Columns distributions are computed for
+    "victories",
+    "total_points",
+    "total_eliminations",
+    "total_placing",
+    "games_played",
+    "win_rate",
+    "placing_rate",
+    "points_per_game",
+)
+
+
+class ColumnDistribution:
+    """Distribution of the values of one leaderboard column
+
+    Values are sorted once on creation so that every query afterwards is a binary
+    search or a lookup in the precomputed prefix sums.
+
+    Args:
+        values (Iterable[Number]): values of the column
+    """
+
+    def __init__(self, values):
+        # Counts are kept as ints so that they format the same as in leaderboards
+        self.values = sorted(
+            value if isinstance(value, int) else float(value) for value in values
+        )
+        self.count = len(self.values)
+        self._sums = [0.0] + list(accumulate(self.values))
+        self._squares = [0.0] + list(accumulate(value ** 2 for value in self.values))
+
+    def percentile(self, value):
+        """Returns the share of values that are lower than or equal to a value
+
+        Args:
+            value (Number): value to get the percentile of
+
+        Returns:
+            float: percentile within [0, 1]
+        """
+        if not self.count:
+            return 0.0
+
+        return bisect_right(self.values, value) / self.count
+
+    def rank(self, value):
+        """Returns the position a value would have if sorted descending
+
+        Args:
+            value (Number): value to get the rank of
+
+        Returns:
+            int: 1 based rank, ties share the best rank
+        """
+        return self.count - bisect_right(self.values, value) + 1
+
+    def band(self, value):
+        """Returns the smallest rank band a value falls into
+
+        Args:
+            value (Number): value to get the band of
+
+        Returns:
+            int or None: size of the band or None if outside all bands
+        """
+        rank = self.rank(value)
+        index = bisect_left(RANK_BANDS, rank)
+
+        return RANK_BANDS[index] if index < len(RANK_BANDS) else None
+
+    def quantile(self, q):
+        """Returns the value at a quantile
+
+        Args:
+            q (float): quantile within [0, 1]
+
+        Returns:
+            float or None: the value or None if there are no values
+        """
+        if not self.count:
+            return None
+
+        return self.values[min(self.count - 1, int(q * self.count))]
+
+    def top_mean(self, length):
+        """Returns the mean of the highest values
+
+        Args:
+            length (int): number of highest values to average
+
+        Returns:
+            float or None: the mean or None if there are no values
+        """
+        length = min(length, self.count)
+
+        if not length:
+            return None
+
+        return (self._sums[-1] - self._sums[-length - 1]) / length
+
+    def summary(self):
+        """Returns summary statistics of the values
+
+        Returns:
+            dict: count, min, max, mean, standard deviation, median, p90 and p99
+        """
+        if not self.count:
+            return {"count": 0}
+
+        mean = self._sums[-1] / self.count
+        variance = max(0.0, self._squares[-1] / self.count - mean ** 2)
+
+        return {
+            "count": self.count,
+            "min": self.values[0],
+            "max": self.values[-1],
+            "mean": mean,
+            "stdev": sqrt(variance),
+            "median": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+
+def build_distributions(views, columns=ANALYTICS_COLUMNS):
+    """Computes the distribution of every analysed column of every view
+
+    Args:
+        views (dict): mapping of view name to columnar view data, as published in
+                      leaderboard snapshots
+        columns (Tuple[str], optional): columns to compute distributions for
+
+    Returns:
+        dict: mapping of (view, column) to its ColumnDistribution
+    """
+    return {
+        (view, column): ColumnDistribution(data[column])
+        for view, data in views.items()
+        for column in columns
+        if column in data
+    }
@@ -0,0 +1,93 @@
+import time
+from functools import wraps
+from threading import Lock
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when an upstream api can not be used to serve a request"""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """Raised when a call is rejected because its circuit is open"""
+
+
+class CircuitBreaker:
+    """Stops calls to an upstream api after repeated failures so that callers fail
+    fast instead of waiting on requests that are likely to time out
+
+    Once open, a single trial call is let through every reset_timeout seconds, and
+    the circuit closes again as soon as one succeeds.
+
+    Args:
+        name (str): name of the upstream, used in error messages
+        exceptions (Tuple[Type[Exception]], optional): exceptions counted as
+                                                       failures, defaults to all
+        failure_threshold (int, optional): consecutive failures after which the
+                                           circuit opens, defaults to 5
+        reset_timeout (float, optional): seconds to wait before a trial call,
+                                         defaults to 30
+    """
+
+    def __init__(
+        self, name, exceptions=(Exception,), failure_threshold=5, reset_timeout=30
+    ):
+        self.name = name
+        self.exceptions = exceptions
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = Lock()
+
+    @property
+    def is_open(self):
+        """bool: whether calls are currently being rejected"""
+        with self._lock:
+            if self._opened_at is None:
+                return False
+
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Let a trial call through and reject others until it completes
+                self._opened_at = time.monotonic()
+                return False
+
+            return True
+
+    def call(self, func, *args, **kwargs):
+        """Calls a function through the circuit breaker
+
+        Args:
+            func (Callable): function that calls the upstream api
+            args, kwargs: passed to func
+
+        Raises:
+            CircuitOpenError: if the circuit is open
+
+        Returns:
+            Any: the result of func
+        """
+        if self.is_open:
+            raise CircuitOpenError(f"{self.name} is currently unavailable")
+
+        try:
+            result = func(*args, **kwargs)
+        except self.exceptions:
+            with self._lock:
+                self._failures += 1
+
+                if self._failures >= self.failure_threshold:
+                    self._opened_at = time.monotonic()
+            raise
+
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+        return result
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+
+        return wrapper
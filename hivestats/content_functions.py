@@ -27,6 +27,18 @@ RANK_DICT = {
 TOP_RANK = "Billy Elliot"
 
 
+def get_rank(points):
+    """Gets the rank reached with the points provided
+
+    Args:
+        points (int): total current points
+
+    Returns:
+        str: name of current rank
+    """
+    return reduce(lambda x, y: y if points >= RANK_DICT[y] else x, RANK_DICT.keys())
+
+
 def get_next_rank(points):
     """Gets the next rank up from the points provided
 
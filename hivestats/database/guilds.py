@@ -0,0 +1,136 @@
+from psycopg2.extensions import AsIs
+
+from .leaderboard import GAMES, PERIODS, SORT_COLUMNS, SORT_ORDERS, STATS_COLUMNS
+from .sql import Postgres
+
+MEMBER_TABLE = "guild_members"  # Stores the players registered to each guild
+MEMBER_COLUMNS = ("member", "guild_id", "uuid")
+
+
+def member_key(guild_id, uuid):
+    """Returns the unique key identifying a registered member"""
+    return f"{guild_id}:{uuid}"
+
+
+def query_members(database: Postgres, guild_id):
+    """Returns the players registered to a guild
+
+    Args:
+        database (Postgres): interface to interact with the database
+        guild_id (int): id of the guild
+
+    Returns:
+        List[str]: uuids of the registered players
+    """
+    database.cursor.execute(
+        """
+            select uuid from %(table)s where guild_id = %(guild_id)s;
+        """,
+        {"table": AsIs(MEMBER_TABLE), "guild_id": guild_id},
+    )
+
+    return [row["uuid"] for row in database.cursor.fetchall()]
+
+
+def add_member(database: Postgres, guild_id, uuid):
+    """Registers a player to a guild, registering a player twice has no effect
+
+    Args:
+        database (Postgres): interface to interact with the database
+        guild_id (int): id of the guild
+        uuid (str): id of the player
+    """
+    database.insert(
+        MEMBER_TABLE,
+        MEMBER_COLUMNS,
+        ((member_key(guild_id, uuid), guild_id, uuid),),
+        conflict_key=MEMBER_COLUMNS[0],
+    )
+
+
+def remove_member(database: Postgres, guild_id, uuid):
+    """Unregisters a player from a guild
+
+    Args:
+        database (Postgres): interface to interact with the database
+        guild_id (int): id of the guild
+        uuid (str): id of the player
+
+    Returns:
+        bool: whether the player was registered
+    """
+    database.cursor.execute(
+        """
+            delete from %(table)s where member = %(member)s;
+        """,
+        {"table": AsIs(MEMBER_TABLE), "member": member_key(guild_id, uuid)},
+    )
+
+    return database.cursor.rowcount > 0
+
+
+def query_guild_leaderboard(
+    database: Postgres,
+    guild_id,
+    start,
+    length=1,
+    sort_by="total_points",
+    sort_order="desc",
+    game="bp",
+    period="all",
+):
+    """Returns leaderboard entries of the players registered to a guild, ranked
+    among each other, in a single query joining the members with a period view
+
+    Args:
+        database (Postgres): interface to interact with the database
+        guild_id (int): id of the guild
+        start (int): index of the first entry to get
+        length (int, optional): number of entries to get, defaults to 1
+        sort_by (str, optional): column to sort by, defaults to total_points
+        sort_order (str, optional): asc or desc, defaults to desc
+        game (str, optional): identifier for game, defaults to bp
+        period (str, optional): period of the view, defaults to all time
+
+    Raises:
+        ValueError: if any of game, period, sort_by or sort_order is not known
+
+    Returns:
+        Tuple(dict): leaderboard entries numbered by row_num
+    """
+    if (
+        game not in GAMES
+        or period not in PERIODS
+        or sort_by not in SORT_COLUMNS
+        or sort_order not in SORT_ORDERS
+    ):
+        raise ValueError(
+            f"Invalid guild leaderboard query: {game}, {period}, {sort_by}, "
+            f"{sort_order}"
+        )
+
+    database.cursor.execute(
+        """
+            select row_number() over (order by stats.%(sort_by)s %(sort_order)s)
+                       as row_num,
+                   %(columns)s
+                from %(table)s members
+                join %(game)s_%(period)s_view stats on stats.uuid = members.uuid
+                where members.guild_id = %(guild_id)s
+                order by row_num
+                limit %(length)s offset %(start)s;
+        """,
+        {
+            "sort_by": AsIs(sort_by),
+            "sort_order": AsIs(sort_order),
+            "columns": AsIs(", ".join(f"stats.{column}" for column in STATS_COLUMNS)),
+            "table": AsIs(MEMBER_TABLE),
+            "game": AsIs(game),
+            "period": AsIs(period),
+            "guild_id": guild_id,
+            "length": length,
+            "start": start,
+        },
+    )
+
+    return tuple(dict(row) for row in database.cursor.fetchall())
@@ -1,19 +1,74 @@
+import hashlib
+from array import array
 from os import path
-import schedule
 import time
+import traceback
 from datetime import datetime, timedelta
 from typing import NamedTuple
-import yaml
 
+from psycopg2.errors import UndefinedTable
 from psycopg2.extensions import AsIs
 
 from ..hive_api import leaderboard
+from ..metrics import compute_metrics, metric_expressions
+from .snapshot import NOTIFY_CHANNEL, SnapshotChannel, to_columns
 from .sql import Postgres
+from .views import create_views, drop_views, refresh_views, view_statements
 
 LEADERBOARD_LENGTH = 1000  # Number of players on the Hive leaderboard
 API_MAX_CALL_SIZE = 200  # Max leaderboard entries retrievable per api call
+GAMES = ("bp",)  # Games with cached leaderboards
+PERIODS = ("all", "monthly", "weekly", "daily")  # Periods with a cached view
+SORT_ORDERS = ("asc", "desc")
+SORT_COLUMNS = (  # Columns leaderboards can be sorted by
+    "victories",
+    "total_points",
+    "total_eliminations",
+    "total_placing",
+    "games_played",
+    "win_rate",
+    "placing_rate",
+    "points_per_game",
+)
+STATS_COLUMNS = (  # Columns shared by every period view
+    "position",
+    "uuid",
+    "victories",
+    "total_points",
+    "total_eliminations",
+    "total_placing",
+    "games_played",
+    "username",
+    "win_rate",
+    "placing_rate",
+    "points_per_game",
+)
+HIVE_COLUMNS = {  # Column each key of the Hive leaderboard entries is stored in
+    "bp": {
+        "index": "index",
+        "human_index": "human_index",
+        "UUID": "uuid",
+        "victories": "victories",
+        "total_points": "total_points",
+        "total_eliminations": "total_eliminations",
+        "total_placing": "total_placing",
+        "games_played": "games_played",
+        "username": "username",
+    },
+}
+HISTORY_STATS = (  # Columns of history tables used to chart trends
+    "human_index",
+    "victories",
+    "total_points",
+    "total_placing",
+    "games_played",
+)
+
+BACKOFF_BASE = 60  # Seconds a failed job waits before its first retry
+BACKOFF_MAX = 3600  # Max seconds a repeatedly failing job waits between retries
 
 SQL_NOW = "now()"  # Constant for the timestamp function used in postgres
+SCHEMA_KEY = "tables"  # Key the fingerprint of tables.yaml is stored under
 UNIT_DICT = {  # Shortcode mapping for time units
     "s": timedelta(seconds=1),
     "m": timedelta(minutes=1),
@@ -25,64 +80,258 @@ UNIT_DICT = {  # Shortcode mapping for time units
 DIR_PATH = path.dirname(__file__)
 TABLE_FILE = path.join(DIR_PATH, "tables.yaml")
 
+SNAPSHOTS = SnapshotChannel()  # Shares refreshed leaderboards with the bot
+
+
+class BackoffJob:
+    """Wraps a scheduled job so that failures are logged and retried with an
+    exponential backoff instead of stopping every other scheduled job
+
+    Args:
+        func (Callable): the job
+        args: passed to func on every run
+    """
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+        self.failures = 0
+        self.retry_at = 0
+
+    def __call__(self):
+        now = time.monotonic()
+
+        if now < self.retry_at:
+            return
+
+        try:
+            self.func(*self.args)
+        except Exception:
+            self.failures += 1
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.failures - 1))
+            self.retry_at = now + delay
+
+            traceback.print_exc()
+            print(f"{self.func.__name__} failed, retrying in {delay} seconds")
+        else:
+            self.failures = 0
+
 
 class Table(NamedTuple):
     name: str
     columns: tuple
     types: tuple
     constraints: dict = None
+    indexes: list = None
     update_freq: str = None
+    rotate: dict = None
+    history: str = None
+    retention: list = None
 
 
 def scheduled_update():
     """Starts the scheduled auto update of the cached hive leaderboards
+
+    Note:
+        table creation is skipped entirely if tables.yaml has not changed since the
+        tables were last set up
     """
-    database = Postgres()
+    import schedule  # Deferred as only the updater process needs these
+    import yaml
 
-    with open(TABLE_FILE, "r") as file:
-        tables = yaml.safe_load(file)
+    from .maintenance import MAINTENANCE_FREQ, run_maintenance
 
-    global LAST_UPDATED
-    LAST_UPDATED = Table(**tables["last_updated"])
+    database = Postgres()
+
+    with open(TABLE_FILE, "rb") as file:
+        raw_tables = file.read()
 
-    for table in tables.values():
-        setup_table(database, Table(**table))
+    tables = yaml.safe_load(raw_tables)
+    # Views are part of the schema, so changing their definition migrates it too
+    views = "".join(
+        statement
+        for game in GAMES
+        for period in PERIODS
+        for statement in view_statements(game, period)
+    )
+    fingerprint = hashlib.sha1(raw_tables + views.encode()).hexdigest()
+
+    global TABLES, LAST_UPDATED, SCHEMA_FINGERPRINT
+    TABLES = {name: Table(**table) for name, table in tables.items()}
+    LAST_UPDATED = TABLES["last_updated"]
+    SCHEMA_FINGERPRINT = TABLES["schema_fingerprint"]
+
+    # The schema is migrated before any update runs, so that nothing is published
+    # from views that are about to be replaced
+    if query_fingerprint(database) != fingerprint:
+        for table in TABLES.values():
+            create_schema(database, table)
+
+        for game in GAMES:
+            fill_metrics(database, game)
+            create_views(database, game, PERIODS)
+
+        database.insert(
+            SCHEMA_FINGERPRINT.name,
+            SCHEMA_FINGERPRINT.columns,
+            ((SCHEMA_KEY, fingerprint),),
+            conflict_key=SCHEMA_FINGERPRINT.columns[0],
+        )
+
+    for table in TABLES.values():
+        setup_table(database, table)
+
+    # Readers may hold a snapshot of a previous run, so a fresh one is always
+    # published at boot
+    BackoffJob(publish_snapshot, database)()
+
+    schedule.every(int(parse_period(MAINTENANCE_FREQ).total_seconds())).seconds.do(
+        BackoffJob(run_maintenance, database, TABLES.values())
+    )
 
     while True:
         schedule.run_pending()
         time.sleep(1)
 
 
+def create_schema(database: Postgres, table: Table):
+    """Creates a table with its constraints and indexes, adding columns that are
+    missing if it already exists
+
+    Args:
+        database (Postgres): interface to interact with the database
+        table (Table): defines the structure of the table
+    """
+    database.create_table(table.name, table.columns, table.types, raise_error=False)
+    # Columns added to tables.yaml after a table was created are migrated
+    database.add_columns(table.name, table.columns, table.types)
+
+    create_constraints(database, table)
+
+
 def setup_table(database: Postgres, table: Table):
-    """Takes a table object and runs all the required steps to create it and setup
-    scheduled updates on the specified database
+    """Takes a table object and sets up its scheduled updates on the specified
+    database, running the first check right away
 
     Args:
         database (Postgres): interface to interact with the database
         table (Table): defines the structure of the table to upload data to
     """
-    database.create_table(table.name, table.columns, table.types, raise_error=False)
+    import schedule
+
+    if table.update_freq or table.rotate:
+        job = BackoffJob(check_outdated, database, table)
+        job()
+        schedule.every().minute.do(job)
+
 
+def create_constraints(database: Postgres, table: Table):
+    """Adds the constraints and indexes of a table that do not exist yet
+
+    Args:
+        database (Postgres): interface to interact with the database
+        table (Table): defines the constraints and indexes to add
+    """
     if table.constraints:
         for column, constraint in table.constraints.items():
             database.add_constraint(table.name, column, constraint, raise_error=False)
 
-    if table.update_freq:
-        check_outdated(database, table)
-        schedule.every().minute.do(check_outdated, database, table)
+    for columns in table.indexes or ():
+        database.create_index(table.name, columns)
 
 
-def check_outdated(database, data_table):
-    """Checks if a table is outdated based on it's update frequency and updates it
+def fill_metrics(database: Postgres, game="bp"):
+    """Computes the stored metrics of all time rows that have none, which is the
+    case for rows stored before the metric columns were added
 
     Args:
         database (Postgres): interface to interact with the database
-        data_table (Table): the table that needs to be checked
+        game (str, optional): identifier for game, defaults to bp
     """
-    now = datetime.utcnow()
-    period = data_table.update_freq
-    length, unit = int(period[:-1]), period[-1:]
+    expressions = metric_expressions(game)
+
+    if not expressions:
+        return
+
+    database.cursor.execute(
+        """
+            update %(table)s set %(assignments)s where %(missing)s;
+        """,
+        {
+            "table": AsIs(f"{game}_all"),
+            "assignments": AsIs(
+                ", ".join(f"{name} = {sql}" for name, sql in expressions.items())
+            ),
+            "missing": AsIs(" or ".join(f"{name} is null" for name in expressions)),
+        },
+    )
+
+
+def query_fingerprint(database: Postgres):
+    """Returns the fingerprint of tables.yaml when the tables were last set up
 
+    Args:
+        database (Postgres): interface to interact with the database
+
+    Returns:
+        str or None: the stored fingerprint or None if the tables were never set up
+    """
+    try:
+        database.cursor.execute(
+            """
+                select %(fingerprint_col)s from %(fingerprint_table)s
+                    where %(name_col)s = %(target)s
+            """,
+            {
+                "fingerprint_table": AsIs(SCHEMA_FINGERPRINT.name),
+                "name_col": AsIs(SCHEMA_FINGERPRINT.columns[0]),
+                "fingerprint_col": AsIs(SCHEMA_FINGERPRINT.columns[1]),
+                "target": SCHEMA_KEY,
+            },
+        )
+    except UndefinedTable:
+        return None
+
+    fingerprint = database.cursor.fetchone()
+
+    return fingerprint[0] if fingerprint else None
+
+
+def period_start(now, every, offset=timedelta(0)):
+    """Returns the start of the calendar period a time falls in
+
+    Args:
+        now (datetime): the time, in UTC
+        every (str): length of the period, one of day, week or month
+        offset (timedelta, optional): shift of the period's edges from midnight,
+                                      and from monday or the first of the month
+
+    Returns:
+        datetime: the start of the period
+    """
+    shifted = now - offset
+    start = shifted.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if every == "week":
+        start -= timedelta(days=start.weekday())
+    elif every == "month":
+        start = start.replace(day=1)
+    elif every != "day":
+        raise ValueError(f"Invalid rotation period {every}")
+
+    return start + offset
+
+
+def query_last_updated(database: Postgres, name):
+    """Returns when a table was last updated
+
+    Args:
+        database (Postgres): interface to interact with the database
+        name (str): name of the table
+
+    Returns:
+        datetime or None: time of the last update, None if never updated
+    """
     database.cursor.execute(
         """
             select %(update_col)s from %(update_table)s
@@ -92,27 +341,111 @@ def check_outdated(database, data_table):
             "update_table": AsIs(LAST_UPDATED.name),
             "name_col": AsIs(LAST_UPDATED.columns[0]),
             "update_col": AsIs(LAST_UPDATED.columns[1]),
-            "target": data_table.name,
+            "target": name,
         },
     )
 
     updated = database.cursor.fetchone()
 
-    if updated:
-        updated = updated[0]
+    return updated[0] if updated else None
 
-        if unit == "M":
-            if (
-                ((now.year - updated.year) * 12) + (now.month - updated.month)
-            ) < length:
-                return False
-        else:
-            if (now - updated) < (UNIT_DICT[unit] * length):
-                return False
+
+def check_outdated(database, data_table):
+    """Checks if a table is outdated and updates it
+
+    Tables with an update frequency are outdated once it has passed since their
+    last update, rotated tables once a calendar edge has passed since then.
+
+    Args:
+        database (Postgres): interface to interact with the database
+        data_table (Table): the table that needs to be checked
+    """
+    now = datetime.utcnow()
+    updated = query_last_updated(database, data_table.name)
+
+    if data_table.rotate:
+        start = period_start(
+            now,
+            data_table.rotate["every"],
+            parse_period(data_table.rotate.get("offset", "0h")),
+        )
+
+        if updated and updated >= start:
+            return False
+
+        return rotate_table(database, data_table)
+
+    if updated and (now - updated) < parse_period(data_table.update_freq):
+        return False
 
     update_leaderborad(database, data_table)
 
 
+def rotate_table(database: Postgres, data_table: Table, game="bp"):
+    """Replaces the baseline of a period with the current all time leaderboard
+
+    The new baseline is built in a shadow table beforehand, which is then swapped
+    in together with the period's view in a single transaction, so readers of the
+    view either see the old or the new baseline in full.
+
+    Args:
+        database (Postgres): interface to interact with the database
+        data_table (Table): the period's table, named {game}_{period}
+        game (str, optional): identifier for game, defaults to bp
+
+    Returns:
+        bool: whether the table was rotated, it is not while the all time
+              leaderboard is still empty
+    """
+    period = data_table.name[len(game) + 1 :]
+
+    database.cursor.execute(
+        """
+            select %(columns)s from %(game)s_all;
+        """,
+        {"columns": AsIs(", ".join(data_table.columns)), "game": AsIs(game)},
+    )
+    rows = tuple(tuple(row) for row in database.cursor.fetchall())
+
+    if not rows:
+        return False
+
+    shadow = data_table._replace(name=f"{data_table.name}_temp")
+    old_name = f"{data_table.name}_old"
+
+    # Leftovers of a rotation that failed after its swap are cleaned up first, so
+    # that the shadow table's indexes get names that are free
+    database.drop_table(old_name)
+    database.rename_indexes(data_table.name, shadow.name, data_table.name)
+
+    # The shadow table is filled and indexed up front, so that the transaction only
+    # holds its locks for the swap and the view
+    database.create_table(shadow.name, shadow.columns, shadow.types, force=True)
+    database.insert(shadow.name, shadow.columns, rows)
+    create_constraints(database, shadow)
+
+    with database.transaction():
+        # The view depends on the old table, so it is recreated on the new one
+        drop_views(database, game, (period,))
+        database.rename_table(data_table.name, old_name)
+        database.rename_table(shadow.name, data_table.name)
+        create_views(database, game, (period,))
+        database.insert(
+            LAST_UPDATED.name,
+            LAST_UPDATED.columns,
+            ((data_table.name, SQL_NOW),),
+            conflict_key=LAST_UPDATED.columns[0],
+        )
+
+    # Indexes were named after the shadow table and take over the names of the old
+    # table's indexes once it is gone
+    database.drop_table(old_name)
+    database.rename_indexes(data_table.name, shadow.name, data_table.name)
+
+    publish_snapshot(database, game)
+    return True
+
+
 def update_leaderborad(database, data_table, game="bp"):
     """Retrieve full leaderboard for specified game and upload it to database table
 
@@ -130,11 +463,19 @@ def update_leaderborad(database, data_table, game="bp"):
     for start in range(0, LEADERBOARD_LENGTH, API_MAX_CALL_SIZE):
         data += leaderboard(game, start, API_MAX_CALL_SIZE)
 
-    data = tuple(tuple(row.values()) for row in data)
+    keys = HIVE_COLUMNS[game]
+    columns = {keys[key]: values for key, values in to_columns(data, keys).items()}
+    # Derived metrics are computed once per update for whole columns and stored
+    columns.update(compute_metrics(columns, game))
+    data = tuple(zip(*(columns[column] for column in data_table.columns)))
 
     database.insert(
         data_table.name, data_table.columns, data, conflict_key=data_table.columns[0]
     )
+    refresh_views(database, game, PERIODS)
+
+    if data_table.history:
+        record_history(database, data_table, TABLES[data_table.history])
 
     database.insert(
         LAST_UPDATED.name,
@@ -143,6 +484,82 @@ def update_leaderborad(database, data_table, game="bp"):
         conflict_key=LAST_UPDATED.columns[0],
     )
 
+    publish_snapshot(database, game)
+
+
+def record_history(database: Postgres, data_table: Table, history_table: Table):
+    """Appends the current contents of a table to its history table
+
+    Args:
+        database (Postgres): interface to interact with the database
+        data_table (Table): table to take a snapshot of
+        history_table (Table): table to append to, its first column holds the time
+                               of the snapshot and the rest are copied from data_table
+    """
+    columns = ", ".join(history_table.columns[1:])
+
+    database.cursor.execute(
+        """
+            insert into %(history)s (%(time_col)s, %(columns)s)
+                select %(now)s, %(columns)s from %(table)s;
+        """,
+        {
+            "history": AsIs(history_table.name),
+            "time_col": AsIs(history_table.columns[0]),
+            "columns": AsIs(columns),
+            "now": AsIs(SQL_NOW),
+            "table": AsIs(data_table.name),
+        },
+    )
+
+
+def parse_period(period):
+    """Converts a period shortcode such as 5m or 7d to a timedelta
+
+    Args:
+        period (str): length followed by a unit from UNIT_DICT
+
+    Returns:
+        timedelta: the length of the period
+    """
+    return UNIT_DICT[period[-1:]] * int(period[:-1])
+
+
+def load_snapshot(database: Postgres, game="bp"):
+    """Loads every period view of a game in columnar form
+
+    Args:
+        database (Postgres): interface to interact with the database
+        game (str, optional): identifier for game, defaults to bp
+
+    Returns:
+        dict: mapping of view name to columnar view data
+    """
+    snapshot = {}
+
+    for period in PERIODS:
+        view = f"{game}_{period}_view"
+        database.cursor.execute(
+            """
+                select %(columns)s from %(view)s;
+            """,
+            {"columns": AsIs(", ".join(STATS_COLUMNS)), "view": AsIs(view)},
+        )
+        snapshot[view] = to_columns(database.cursor.fetchall(), STATS_COLUMNS)
+
+    return snapshot
+
+
+def publish_snapshot(database: Postgres, game="bp"):
+    """Publishes the current state of the cached leaderboards to the bot
+
+    Args:
+        database (Postgres): interface to interact with the database
+        game (str, optional): identifier for game, defaults to bp
+    """
+    version = SNAPSHOTS.publish(load_snapshot(database, game))
+    database.notify(NOTIFY_CHANNEL, str(version))
+
 
 def query_leaderboard(
     database: Postgres,
@@ -173,45 +590,164 @@ def query_leaderboard(
     Returns:
         Tuple(dict): tuple of leaderboard entries
     """
-    database.cursor.execute(
-        """
+    statement = prepare_leaderboard(database, game, period, sort_by, sort_order)
+    database.execute_prepared(statement, (start, length))
+
+    return database.cursor.fetchall()
+
+
+def prepare_leaderboard(database: Postgres, game, period, sort_by, sort_order):
+    """Prepares the leaderboard query for a combination of parameters on the
+    database's connection, if it was not already prepared
+
+    Args:
+        database (Postgres): interface to interact with the database
+        game (str): identifier for game
+        period (str): used to determine the correct table to query from
+        sort_by (str): column to sort results by
+        sort_order (str): whether to sort asc or desc
+
+    Raises:
+        ValueError: if any of the parameters is not a known game, period, column
+                    or order
+
+    Returns:
+        str: name of the prepared statement, which takes the start and length
+    """
+    if (
+        game not in GAMES
+        or period not in PERIODS
+        or sort_by not in SORT_COLUMNS
+        or sort_order not in SORT_ORDERS
+    ):
+        raise ValueError(
+            f"Invalid leaderboard query: {game}, {period}, {sort_by}, {sort_order}"
+        )
+
+    statement = f"lb_{game}_{period}_{sort_by}_{sort_order}"
+    database.prepare(
+        statement,
+        f"""
             select * from (
-                select row_number() over (order by %(sort_by)s %(sort_order)s) as row_num,
+                select row_number() over (order by {sort_by} {sort_order}) as row_num,
                     *
-                from %(game)s_%(period)s_view
+                from {game}_{period}_view
             ) sorted
-                where row_num > %(start)s
-                limit %(limit)s;
+                where row_num > $1
+                limit $2
         """,
-        {
-            "game": AsIs(game),
-            "period": AsIs(period),
-            "start": AsIs(start),
-            "limit": AsIs(length),
-            "sort_by": AsIs(sort_by),
-            "sort_order": AsIs(sort_order),
-        },
     )
 
-    return database.cursor.fetchall()
+    return statement
 
 
-def query_stats(database: Postgres, uuid, game="bp", period="all"):
-    """Returns stats for a player from the appropriate table
+def query_stats_many(database: Postgres, uuids, game="bp", period="all"):
+    """Returns stats for several players from the appropriate table in one query
 
     Args:
-        databse (Postgres): interface to interact with the database
-        uuid (str): id of player to retrieve data for
+        database (Postgres): interface to interact with the database
+        uuids (Iterable[str]): ids of players to retrieve data for
         game (str, optional): identifier for game, defaults to bp
         period (str, optional): used to determine the correct table to query from,
                                 defaults to all time
+
+    Raises:
+        ValueError: if game or period is not known
+
+    Returns:
+        dict: mapping of uuid to stats for every player that has cached stats
+    """
+    if game not in GAMES or period not in PERIODS:
+        raise ValueError(f"Invalid stats query: {game}, {period}")
+
+    database.cursor.execute(
+        f"""
+            select * from {game}_{period}_view
+                where uuid = any(%(uuids)s);
+        """,
+        {"uuids": list(uuids)},
+    )
+
+    return {row["uuid"]: row for row in database.cursor.fetchall()}
+
+
+def query_stats_periods(database: Postgres, uuid, game="bp", periods=PERIODS):
+    """Returns stats for a player for several periods in a single query
+
+    Args:
+        database (Postgres): interface to interact with the database
+        uuid (str): id of player to retrieve data for
+        game (str, optional): identifier for game, defaults to bp
+        periods (Tuple[str], optional): periods to retrieve stats for,
+                                        defaults to all cached periods
+
+    Raises:
+        ValueError: if game or any of the periods is not known
+
+    Returns:
+        dict: mapping of period to stats, periods without stats for the player
+              are omitted
+    """
+    # Views are named after the game and periods, which must never come from input
+    if game not in GAMES or not set(periods).issubset(PERIODS):
+        raise ValueError(f"Invalid stats query: {game}, {', '.join(periods)}")
+
+    columns = ", ".join(STATS_COLUMNS)
+    selects = [
+        f"select '{period}' as period, {columns} from {game}_{period}_view"
+        " where uuid = %(uuid)s"
+        for period in periods
+    ]
+
+    database.cursor.execute(" union all ".join(selects) + ";", {"uuid": uuid})
+
+    return {row["period"]: row for row in database.cursor.fetchall()}
+
+
+def query_history(database: Postgres, uuids, days, game="bp"):
+    """Returns the recent history of several players as compact arrays
+
+    Args:
+        database (Postgres): interface to interact with the database
+        uuids (Iterable[str]): ids of players to retrieve history for
+        days (int): number of days of history to retrieve
+        game (str, optional): identifier for game, defaults to bp
+
+    Returns:
+        dict: mapping of uuid to a mapping of column name to an array of that
+              column's values, ordered by time of the snapshot in unix seconds
     """
     database.cursor.execute(
         """
-            select * from %(game)s_%(period)s_view
-                where uuid = %(uuid)s;
+            select uuid, extract(epoch from snapshot_at)::double precision
+                       as snapshot_at,
+                   %(columns)s
+                from %(game)s_history
+                where uuid = any(%(uuids)s)
+                and snapshot_at >= now() - %(days)s * interval '1 day'
+                order by uuid, snapshot_at;
         """,
-        {"game": AsIs(game), "period": AsIs(period), "uuid": uuid},
+        {
+            "columns": AsIs(", ".join(HISTORY_STATS)),
+            "game": AsIs(game),
+            "uuids": list(uuids),
+            "days": days,
+        },
     )
 
-    return database.cursor.fetchone()
+    history = {}
+
+    for row in database.cursor.fetchall():
+        if row["uuid"] not in history:
+            history[row["uuid"]] = {
+                "snapshot_at": array("d"),
+                **{column: array("q") for column in HISTORY_STATS},
+            }
+
+        columns = history[row["uuid"]]
+        columns["snapshot_at"].append(row["snapshot_at"])
+
+        for column in HISTORY_STATS:
+            columns[column].append(row[column])
+
+    return history
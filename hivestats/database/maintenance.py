@@ -0,0 +1,137 @@
+from psycopg2.extensions import AsIs
+
+from .leaderboard import Table, parse_period
+from .sql import Postgres
+
+MAINTENANCE_FREQ = "1h"  # How often snapshot tables are compacted and vacuumed
+
+
+def compact_table(database: Postgres, table: Table):
+    """Downsamples a history table according to its retention tiers
+
+    Each tier keeps the latest row per player for every `keep` interval among rows
+    younger than `for`, rows older than the last tier are dropped.
+
+    Args:
+        database (Postgres): interface to interact with the database
+        table (Table): history table to compact, the first column must be the time
+                       of the snapshot and the second the player's uuid
+
+    Returns:
+        int: number of rows removed
+    """
+    time_col, uuid_col = table.columns[:2]
+    tiers = sorted(table.retention, key=lambda tier: parse_period(tier["for"]))
+    newer_than = 0
+    removed = 0
+
+    for tier in tiers:
+        older_than = parse_period(tier["for"]).total_seconds()
+
+        database.cursor.execute(
+            """
+                delete from %(table)s where ctid in (
+                    select ctid from (
+                        select ctid, row_number() over (
+                            partition by %(uuid_col)s,
+                                floor(extract(epoch from %(time_col)s) / %(keep)s)
+                            order by %(time_col)s desc
+                        ) as bucket_row
+                        from %(table)s
+                            where %(time_col)s < now() - %(newer)s * interval '1 second'
+                            and %(time_col)s >= now() - %(older)s * interval '1 second'
+                    ) buckets
+                        where bucket_row > 1
+                );
+            """,
+            {
+                "table": AsIs(table.name),
+                "uuid_col": AsIs(uuid_col),
+                "time_col": AsIs(time_col),
+                "keep": parse_period(tier["keep"]).total_seconds(),
+                "newer": newer_than,
+                "older": older_than,
+            },
+        )
+        removed += database.cursor.rowcount
+        newer_than = older_than
+
+    database.cursor.execute(
+        """
+            delete from %(table)s
+                where %(time_col)s < now() - %(older)s * interval '1 second';
+        """,
+        {"table": AsIs(table.name), "time_col": AsIs(time_col), "older": newer_than},
+    )
+
+    return removed + database.cursor.rowcount
+
+
+def vacuum_table(database: Postgres, table: Table):
+    """Reclaims space from dead rows and refreshes planner statistics of a table
+
+    Args:
+        database (Postgres): interface to interact with the database
+        table (Table): table to vacuum
+    """
+    database.cursor.execute(
+        """
+            vacuum analyze %(table)s;
+        """,
+        {"table": AsIs(table.name)},
+    )
+
+
+def query_bloat(database: Postgres, tables):
+    """Returns size and dead row statistics of tables
+
+    Args:
+        database (Postgres): interface to interact with the database
+        tables (Iterable[Table]): tables to get statistics for
+
+    Returns:
+        Tuple(dict): name, live rows, dead rows, table size and index size in bytes
+                     of each table
+    """
+    database.cursor.execute(
+        """
+            select relname as name,
+                   n_live_tup as live_rows,
+                   n_dead_tup as dead_rows,
+                   pg_table_size(relid) as table_size,
+                   pg_indexes_size(relid) as index_size
+                from pg_stat_user_tables
+                where relname = any(%(names)s)
+                order by relname;
+        """,
+        {"names": [table.name for table in tables]},
+    )
+
+    return database.cursor.fetchall()
+
+
+def run_maintenance(database: Postgres, tables):
+    """Compacts history tables, vacuums snapshot tables and reports their bloat
+
+    Args:
+        database (Postgres): interface to interact with the database
+        tables (Iterable[Table]): every table defined in tables.yaml
+    """
+    tables = [
+        table
+        for table in tables
+        if table.retention or table.update_freq or table.rotate
+    ]
+
+    for table in tables:
+        if table.retention:
+            removed = compact_table(database, table)
+            print("Compacted {}: removed {} rows".format(table.name, removed))
+
+        vacuum_table(database, table)
+
+    for stats in query_bloat(database, tables):
+        print(
+            "{name}: {live_rows} live rows, {dead_rows} dead rows, "
+            "{table_size} bytes table, {index_size} bytes indexes".format(**stats)
+        )
@@ -0,0 +1,193 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from psycopg2.extensions import AsIs
+
+from .sql import Postgres
+
+NAME_TABLE = "name_history"  # Stores every name of each looked up player
+CHECKED_TABLE = "name_history_checked"  # Stores when each history was last fetched
+NAME_COLUMNS = ("uuid", "position", "name", "changed_at")
+CHECKED_COLUMNS = ("uuid", "checked", "length")
+
+SQL_NOW = "now()"  # Constant for the timestamp function used in postgres
+REVALIDATE_AFTER = timedelta(days=1)  # Age after which stored histories are refetched
+MEMORY_SIZE = 1000  # Max number of histories kept in memory
+
+
+class NameEntry(NamedTuple):
+    name: str
+    changed_at: int = None  # Java timestamp in millisecs, None for original name
+
+
+def query_names(database: Postgres, uuid):
+    """Returns the stored name history of a player
+
+    Args:
+        database (Postgres): interface to interact with the database
+        uuid (str): id of player to retrieve history for
+
+    Returns:
+        datetime or None: when the history was last fetched, None if never stored
+        Tuple(NameEntry): the name history, most recent name first
+    """
+    database.cursor.execute(
+        """
+            select checked.checked, history.name, history.changed_at
+                from %(checked_table)s checked
+                left join %(name_table)s history on history.uuid = checked.uuid
+                where checked.uuid = %(uuid)s
+                order by history.position desc;
+        """,
+        {
+            "checked_table": AsIs(CHECKED_TABLE),
+            "name_table": AsIs(NAME_TABLE),
+            "uuid": uuid,
+        },
+    )
+    rows = database.cursor.fetchall()
+
+    if not rows:
+        return None, ()
+
+    entries = tuple(
+        NameEntry(row["name"], row["changed_at"] or None)
+        for row in rows
+        if row["name"] is not None
+    )
+
+    return rows[0]["checked"], entries
+
+
+def query_all_names(database: Postgres):
+    """Returns every stored name of every player
+
+    Args:
+        database (Postgres): interface to interact with the database
+
+    Returns:
+        Tuple(dict): uuid, name and whether the name is the player's current name
+    """
+    database.cursor.execute(
+        """
+            select uuid, name,
+                   position = max(position) over (partition by uuid) as current
+                from %(name_table)s;
+        """,
+        {"name_table": AsIs(NAME_TABLE)},
+    )
+
+    return database.cursor.fetchall()
+
+
+def store_names(database: Postgres, uuid, entries, stored=()):
+    """Stores a freshly fetched name history, only writing entries that are new
+
+    Args:
+        database (Postgres): interface to interact with the database
+        uuid (str): id of player the history belongs to
+        entries (Tuple[NameEntry]): fetched history, most recent name first
+        stored (Tuple[NameEntry], optional): history that is already stored,
+                                             most recent name first
+    """
+    # Histories only ever grow, so the stored history is checked to be a suffix
+    if len(stored) > len(entries) or entries[len(entries) - len(stored) :] != stored:
+        database.cursor.execute(
+            """
+                delete from %(name_table)s where uuid = %(uuid)s;
+            """,
+            {"name_table": AsIs(NAME_TABLE), "uuid": uuid},
+        )
+        stored = ()
+
+    if len(entries) > len(stored):
+        database.insert(
+            NAME_TABLE,
+            NAME_COLUMNS,
+            tuple(
+                (uuid, position, entry.name, entry.changed_at or 0)
+                for position, entry in enumerate(reversed(entries))
+                if position >= len(stored)
+            ),
+        )
+
+    database.insert(
+        CHECKED_TABLE,
+        CHECKED_COLUMNS,
+        ((uuid, SQL_NOW, len(entries)),),
+        conflict_key=CHECKED_COLUMNS[0],
+    )
+
+
+class NameHistoryStore:
+    """Serves name histories from memory, backed by the database and only fetching
+    from the Mojang api when a stored history is missing or due for revalidation
+
+    Args:
+        database (Postgres): interface to interact with the database
+        fetch (Callable): fetches the history of a uuid from the api, returning
+                          dicts with name and changedToAt, oldest first
+    """
+
+    def __init__(self, database, fetch):
+        self.database = database
+        self.fetch = fetch
+        self._memory = OrderedDict()
+
+    def history(self, uuid):
+        """Returns the name history of a player
+
+        Args:
+            uuid (str): id of player to retrieve history for
+
+        Returns:
+            Tuple(NameEntry): the name history, most recent name first
+        """
+        now = datetime.utcnow()
+
+        if uuid in self._memory:
+            checked, entries = self._memory[uuid]
+
+            if now - checked < REVALIDATE_AFTER:
+                self._memory.move_to_end(uuid)
+                return entries
+        else:
+            checked, entries = query_names(self.database, uuid)
+
+        if checked is None or now - checked >= REVALIDATE_AFTER:
+            try:
+                fetched = tuple(
+                    NameEntry(entry["name"], entry.get("changedToAt"))
+                    for entry in reversed(self.fetch(uuid))
+                )
+            except Exception:
+                # A stale history is better than none if the api is unavailable
+                if not entries:
+                    raise
+
+                checked = now
+            else:
+                store_names(self.database, uuid, fetched, entries)
+                checked, entries = now, fetched
+
+        self._memory[uuid] = (checked, entries)
+        self._memory.move_to_end(uuid)
+
+        if len(self._memory) > MEMORY_SIZE:
+            self._memory.popitem(last=False)
+
+        return entries
+
+    def current_name(self, uuid):
+        """Returns the current name of a player
+
+        Args:
+            uuid (str): id of player to retrieve the name of
+
+        Returns:
+            str or None: the current name or None if the player has no history
+        """
+        entries = self.history(uuid)
+
+        return entries[0].name if entries else None
@@ -0,0 +1,356 @@
+import hashlib
+import json
+import mmap
+import os
+import stat
+import struct
+import tempfile
+from os import path
+
+SNAPSHOT_DIR = os.environ.get(  # Only ever readable by the user running the bot
+    "SNAPSHOT_DIR", path.join(tempfile.gettempdir(), f"hivestats-{os.getuid()}")
+)
+NOTIFY_CHANNEL = "leaderboard_refresh"  # Postgres channel refreshes are announced on
+
+# Layout of the shared version counters, the published version and the last version
+# ever issued, which keeps versions unique across restarts of the updater
+VERSION_STRUCT = struct.Struct("<QQ")
+
+
+def to_columns(rows, columns):
+    """Converts rows into a columnar mapping
+
+    Args:
+        rows (Iterable[dict]): rows to convert
+        columns (Tuple[str]): names of the columns to keep
+
+    Returns:
+        dict: mapping of column name to a tuple of that column's values
+    """
+    rows = list(rows)
+    return {column: tuple(row[column] for row in rows) for column in columns}
+
+
+def to_rows(columns):
+    """Converts a columnar mapping back into rows
+
+    Args:
+        columns (dict): mapping of column name to a tuple of values
+
+    Returns:
+        Tuple(dict): the rows the columns were built from
+    """
+    names = tuple(columns)
+    return tuple(dict(zip(names, values)) for values in zip(*columns.values()))
+
+
+def content_version(views):
+    """Returns a version for a snapshot that was not published through a channel
+
+    The version is derived from the content of the snapshot, so that it is the same
+    in every process that loaded it and never reused for different content.
+
+    Args:
+        views (dict): mapping of view name to columnar view data
+
+    Returns:
+        int: the version, never 0
+    """
+    digest = hashlib.sha1(json.dumps(views, sort_keys=True).encode()).hexdigest()
+    return int(digest[:15], 16) or 1
+
+
+def private_directory(directory):
+    """Creates a directory only the current user can access
+
+    Args:
+        directory (str): path of the directory
+
+    Raises:
+        PermissionError: if the directory already exists and is not a directory
+                         owned by and private to the current user
+
+    Returns:
+        str: path of the directory
+    """
+    os.makedirs(directory, 0o700, exist_ok=True)
+    info = os.lstat(directory)
+
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077
+    ):
+        raise PermissionError(f"{directory} is not private to the current user")
+
+    return directory
+
+
+class SnapshotChannel:
+    """Shares leaderboard snapshots between processes running on the same host
+
+    The snapshot itself is written to a file that is atomically swapped into place,
+    after which a version counter in a memory mapped file is bumped. Readers only
+    need to compare the counter to know if they hold the latest snapshot.
+
+    Note:
+        both files live in a directory private to the current user, snapshots are
+        stored as json so that reading one can never execute code
+    """
+
+    def __init__(self, name="hivestats", directory=SNAPSHOT_DIR):
+        self._directory = directory
+        self._data_path = path.join(directory, f"{name}.snapshot")
+        self._version_path = path.join(directory, f"{name}.version")
+        self._version_map = None
+
+    def _counter(self):
+        if self._version_map is None:
+            private_directory(self._directory)
+            fd = os.open(self._version_path, os.O_RDWR | os.O_CREAT, 0o600)
+
+            try:
+                if os.fstat(fd).st_size < VERSION_STRUCT.size:
+                    os.ftruncate(fd, VERSION_STRUCT.size)
+
+                self._version_map = mmap.mmap(fd, VERSION_STRUCT.size)
+            finally:
+                os.close(fd)
+
+        return self._version_map
+
+    @property
+    def version(self):
+        """int: version of the latest published snapshot, 0 if none exists"""
+        return VERSION_STRUCT.unpack_from(self._counter())[0]
+
+    def reset(self):
+        """Discards the published snapshot, which is left over from a previous run
+        when processes start
+        """
+        _, issued = VERSION_STRUCT.unpack_from(self._counter())
+        VERSION_STRUCT.pack_into(self._counter(), 0, 0, issued)
+
+        try:
+            os.remove(self._data_path)
+        except FileNotFoundError:
+            pass
+
+    def publish(self, snapshot):
+        """Publishes a new snapshot to all readers
+
+        Args:
+            snapshot (dict): mapping of view name to columnar view data
+
+        Returns:
+            int: version of the published snapshot
+        """
+        version = max(VERSION_STRUCT.unpack_from(self._counter())) + 1
+        fd, temp_path = tempfile.mkstemp(
+            suffix=".tmp", prefix="snapshot", dir=private_directory(self._directory)
+        )
+
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump({"version": version, "views": snapshot}, file)
+
+            os.replace(temp_path, self._data_path)
+        except BaseException:
+            if path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        VERSION_STRUCT.pack_into(self._counter(), 0, version, version)
+
+        return version
+
+    def read(self):
+        """Reads the latest published snapshot
+
+        Returns:
+            int: version of the snapshot, as stored alongside it
+            dict or None: the snapshot or None if nothing was published yet
+        """
+        if not self.version:
+            return 0, None
+
+        with open(self._data_path) as file:
+            published = json.load(file)
+
+        views = {
+            view: {column: tuple(values) for column, values in data.items()}
+            for view, data in published["views"].items()
+        }
+
+        return published["version"], views
+
+
+class LeaderboardCache:
+    """In-memory copy of the cached leaderboard views kept in sync with the updater
+
+    Snapshots are taken from the shared channel when the updater runs on the same
+    host. Otherwise, the views are reloaded from the database whenever the updater
+    announces a refresh through Postgres notifications.
+
+    Args:
+        channel (SnapshotChannel): channel the updater publishes snapshots to
+        database (Postgres, optional): used as fallback source of snapshots
+        load (Callable, optional): loads a snapshot from the database, required if
+                                   database is provided
+    """
+
+    def __init__(self, channel, database=None, load=None):
+        self.channel = channel
+        self.database = database
+        self.load = load
+        self._listening = False
+        self._derivations = {}
+        # Version, views and memoized derived data are swapped in as a unit
+        self._state = (0, {}, {})
+
+    @property
+    def version(self):
+        """int: version of the snapshot currently held"""
+        return self._state[0]
+
+    def refresh(self):
+        """Swaps in the latest snapshot if a newer one is available
+
+        Returns:
+            bool: whether a new snapshot was swapped in
+        """
+        if self.channel.version:
+            if self.channel.version == self.version:
+                return False
+
+            version, views = self.channel.read()
+        elif self.database is not None:
+            if not self._listening:
+                self.database.listen(NOTIFY_CHANNEL)
+                self._listening = True
+                payloads = []
+            else:
+                payloads = self.database.poll_notifies(NOTIFY_CHANNEL)
+
+                if not payloads and self.version:
+                    return False
+
+            # Versions name files outliving this process, so they are taken from
+            # the updater's notification, which carries the version it published
+            views = self.load(self.database)
+            version = int(payloads[-1]) if payloads else content_version(views)
+        else:
+            return False
+
+        # Registered derivations are computed before the swap so that they never
+        # have to be computed while serving a request
+        memo = {key: func(views) for key, func in self._derivations.items()}
+        self._state = (version, views, memo)
+        return True
+
+    def register(self, key, func):
+        """Registers data to be derived from every new snapshot as it is swapped in
+
+        Args:
+            key (Hashable): identifies the derived data
+            func (Callable): computes the data from the snapshot views
+        """
+        self._derivations[key] = func
+        _, views, memo = self._state
+        memo[key] = func(views)
+
+    def derived(self, key):
+        """Returns registered data derived from the current snapshot
+
+        Args:
+            key (Hashable): identifies the derived data
+
+        Returns:
+            Any: the derived data
+        """
+        self.refresh()
+
+        return self._state[2][key]
+
+    def memoize(self, key, func):
+        """Returns data derived from the current snapshot, computing it at most once
+        per snapshot version
+
+        Args:
+            key (Hashable): identifies the derived data
+            func (Callable): computes the data from the snapshot views
+
+        Returns:
+            Any: the derived data
+        """
+        _, views, memo = self._state
+
+        if key not in memo:
+            memo[key] = func(views)
+
+        return memo[key]
+
+    def rows(self, view):
+        """Returns every row of a view
+
+        Args:
+            view (str): name of the view
+
+        Returns:
+            Tuple(dict) or None: rows of the view or None if it is not cached
+        """
+        self.refresh()
+
+        if view not in self._state[1]:
+            return None
+
+        return self.memoize(("rows", view), lambda views: to_rows(views[view]))
+
+    def player(self, view, uuid):
+        """Returns the row of a player in a view
+
+        Args:
+            view (str): name of the view
+            uuid (str): id of the player
+
+        Returns:
+            dict or None: the player's row or None if not in the cached view
+        """
+        rows = self.rows(view)
+
+        if rows is None:
+            return None
+
+        by_uuid = self.memoize(
+            ("by_uuid", view), lambda views: {row["uuid"]: row for row in rows}
+        )
+
+        return by_uuid.get(uuid)
+
+    def leaderboard(self, view, start, length=1, sort_by="total_points", desc=True):
+        """Returns a sorted slice of a view, numbered like query_leaderboard
+
+        Args:
+            view (str): name of the view
+            start (int): index of the first entry to get
+            length (int, optional): number of entries to get, defaults to 1
+            sort_by (str, optional): column to sort by, defaults to total_points
+            desc (bool, optional): whether to sort descending, defaults to True
+
+        Returns:
+            Tuple(dict) or None: leaderboard entries or None if view is not cached
+        """
+        rows = self.rows(view)
+
+        if rows is None:
+            return None
+
+        ordered = self.memoize(
+            ("sorted", view, sort_by, desc),
+            lambda views: sorted(rows, key=lambda row: row[sort_by], reverse=desc),
+        )
+
+        return tuple(
+            dict(row, row_num=row_num)
+            for row_num, row in enumerate(ordered[start : start + length], start + 1)
+        )
@@ -1,27 +1,84 @@
 import os
+from contextlib import contextmanager
+from uuid import uuid4
+
 import psycopg2
-from psycopg2.extensions import AsIs, ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extensions import (
+    AsIs,
+    ISOLATION_LEVEL_AUTOCOMMIT,
+    ISOLATION_LEVEL_READ_COMMITTED,
+)
 from psycopg2.extras import DictCursor
-from psycopg2.errors import DuplicateTable
+from psycopg2.errors import DuplicateTable, FeatureNotSupported
 
 
 class Postgres:
     """Used to setup connection to and interact with internal Postgres database
+
+    Note:
+        the connection is only opened on first use so that instances can be created
+        before forking worker processes, each of which then opens its own connection
     """
     def __init__(self):
-        self._conn = psycopg2.connect(
-            os.environ["DATABASE_URL"],
-            sslmode="require",
-        )
-
-        self._conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
-        self.cursor = self._conn.cursor(cursor_factory=DictCursor)
+        self._conn = None
+        self._cursor = None
+        self._prepared = {}
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self._conn.close()
+        if self._conn is not None and not self._conn.closed:
+            self._conn.close()
+
+    @property
+    def connection(self):
+        """psycopg2.extensions.connection: the connection, opened if required"""
+        # Connections that were closed by an error are transparently reopened
+        if self._conn is None or self._conn.closed:
+            self._cursor = None
+            self._conn = psycopg2.connect(
+                os.environ["DATABASE_URL"],
+                sslmode="require",
+            )
+
+            self._conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            self._prepared = {}
+
+        return self._conn
+
+    @property
+    def cursor(self):
+        """psycopg2.extras.DictCursor: cursor on the connection, opened if required"""
+        connection = self.connection
+
+        if self._cursor is None:
+            self._cursor = connection.cursor(cursor_factory=DictCursor)
+
+        return self._cursor
+
+    @contextmanager
+    def transaction(self):
+        """Runs every statement executed within the context in a single transaction,
+        which is committed on exit or rolled back if an exception is raised
+
+        Yields:
+            Postgres: this interface
+        """
+        connection = self.connection
+        connection.set_isolation_level(ISOLATION_LEVEL_READ_COMMITTED)
+
+        try:
+            yield self
+        except Exception:
+            if not connection.closed:
+                connection.rollback()
+            raise
+        else:
+            connection.commit()
+        finally:
+            if not connection.closed:
+                connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
 
     def table_exists(self, name):
         """Check if a table exists
@@ -117,7 +174,7 @@ class Postgres:
         """
         self.cursor.execute(
             """
-                drop table if exists %(table)s;
+                drop table if exists %(name)s;
             """,
             {"name": AsIs(name)},
         )
@@ -137,6 +194,35 @@ class Postgres:
             {"name": AsIs(name), "new_name": AsIs(new_name)},
         )
 
+    def rename_indexes(self, table, prefix, new_prefix):
+        """Renames the indexes of a table whose names start with a prefix, which
+        also renames the constraints backed by them
+
+        Args:
+            table (str): name of table the indexes are on
+            prefix (str): prefix of the indexes to rename
+            new_prefix (str): prefix replacing it
+        """
+        self.cursor.execute(
+            """
+                select indexname from pg_indexes
+                    where tablename = %(table)s
+                        and left(indexname, length(%(prefix)s)) = %(prefix)s;
+            """,
+            {"table": table, "prefix": prefix},
+        )
+
+        for (index_name,) in self.cursor.fetchall():
+            self.cursor.execute(
+                """
+                    alter index %(index_name)s rename to %(new_name)s;
+                """,
+                {
+                    "index_name": AsIs(index_name),
+                    "new_name": AsIs(new_prefix + index_name[len(prefix) :]),
+                },
+            )
+
     def insert(self, table, columns, values, *, conflict_key=None):
         """Insert new values into existing table
 
@@ -149,15 +235,20 @@ class Postgres:
                                           column is used to determine and update rows
 
         Note:
-            if provided, the column used as conflict_key must be constrained as unique
+            if provided, the column used as conflict_key must be constrained as unique,
+            conflicting rows whose values are unchanged are left untouched
         """
         conflict_clause = ""
 
         if conflict_key:
             mapping = ", ".join([f"{col} = excluded.{col}" for col in columns])
+            current = ", ".join([f"{table}.{col}" for col in columns])
+            excluded = ", ".join([f"excluded.{col}" for col in columns])
+            # Unchanged rows are skipped to avoid rewriting them as dead tuples
             conflict_clause = f"""
                 on conflict ({conflict_key}) do update
-                    set {mapping}"""
+                    set {mapping}
+                    where ({current}) is distinct from ({excluded})"""
 
         self.cursor.execute(
             """
@@ -208,3 +299,181 @@ class Postgres:
         except DuplicateTable:
             if raise_error:
                 raise DuplicateTable(f"Constraint {constraint_name} already exists")
+
+    def add_columns(self, table, columns, types=None):
+        """Add columns to an existing table, skipping columns that already exist
+
+        Args:
+            table (str): name of table to add columns to
+            columns (Tuple[str]): column names
+            types (Tuple[str], optional): type enforcement for columns
+        """
+        if not types:
+            types = [""] * len(columns)
+
+        col_args = ", ".join(
+            [
+                f"add column if not exists {col_name} {col_type}"
+                for col_name, col_type in zip(columns, types)
+            ]
+        )
+
+        self.cursor.execute(
+            """
+                alter table %(table)s %(col_args)s;
+            """,
+            {"table": AsIs(table), "col_args": AsIs(col_args)},
+        )
+
+    def listen(self, channel):
+        """Subscribe to notifications sent on a channel
+
+        Args:
+            channel (str): name of channel to listen on
+        """
+        self.cursor.execute(
+            """
+                listen %(channel)s;
+            """,
+            {"channel": AsIs(channel)},
+        )
+
+    def notify(self, channel, payload=""):
+        """Send a notification to all listeners of a channel
+
+        Args:
+            channel (str): name of channel to notify
+            payload (str, optional): message sent along with the notification
+        """
+        self.cursor.execute(
+            """
+                select pg_notify(%(channel)s, %(payload)s);
+            """,
+            {"channel": channel, "payload": payload},
+        )
+
+    def poll_notifies(self, channel):
+        """Collect pending notifications received on a channel
+
+        Args:
+            channel (str): name of channel to collect notifications for
+
+        Returns:
+            List[str]: payloads of the received notifications
+        """
+        self.connection.poll()
+
+        notifies = self.connection.notifies
+        payloads = [n.payload for n in notifies if n.channel == channel]
+        notifies[:] = [n for n in notifies if n.channel != channel]
+
+        return payloads
+
+    def create_index(self, table, columns, index_name=None):
+        """Create an index on columns of a table if it does not exist yet
+
+        Args:
+            table (str): name of table to index
+            columns (str): comma separated names of columns to index
+            index_name (str, optional): specific name for index, set to
+                                        {table}_{columns}_index by default
+        """
+        if not index_name:
+            index_name = "{}_{}_index".format(
+                table, "_".join(column.strip() for column in columns.split(","))
+            )
+
+        self.cursor.execute(
+            """
+                create index if not exists %(index_name)s
+                    on %(table)s (%(columns)s);
+            """,
+            {
+                "table": AsIs(table),
+                "columns": AsIs(columns),
+                "index_name": AsIs(index_name),
+            },
+        )
+
+    def prepare(self, name, statement):
+        """Prepare a statement on the server, once per connection
+
+        Args:
+            name (str): name to give the prepared statement
+            statement (str): query to prepare, using $1, $2, ... for parameters
+        """
+        if name in self._prepared:
+            return
+
+        self.cursor.execute(
+            """
+                prepare %(name)s as %(statement)s;
+            """,
+            {"name": AsIs(name), "statement": AsIs(statement)},
+        )
+        self._prepared[name] = statement
+
+    def deallocate(self):
+        """Deallocate every statement prepared on this connection, which is required
+        once the relations they select from changed their columns
+        """
+        if self._conn is None or self._conn.closed:
+            return
+
+        self.cursor.execute("deallocate all;")
+        self._prepared = {}
+
+    def execute_prepared(self, name, args=()):
+        """Execute a statement previously prepared on this connection
+
+        Statements prepared before a view they select from was recreated with other
+        columns are prepared again and retried once.
+
+        Args:
+            name (str): name of the prepared statement
+            args (Tuple(Any), optional): values for the statement's parameters
+        """
+        if args:
+            query = """
+                execute %(name)s %(args)s;
+            """
+            params = {"name": AsIs(name), "args": tuple(args)}
+        else:
+            query = """
+                execute %(name)s;
+            """
+            params = {"name": AsIs(name)}
+
+        try:
+            self.cursor.execute(query, params)
+        except FeatureNotSupported:
+            # Raised as "cached plan must not change result type"
+            statement = self._prepared[name]
+            self.deallocate()
+            self.prepare(name, statement)
+            self.cursor.execute(query, params)
+
+    def stream(self, query, params=None, batch_size=1000):
+        """Iterate over the results of a query using a server side cursor, so that
+        only one batch of rows is held in memory at a time
+
+        Args:
+            query (str): query to execute
+            params (dict, optional): parameters to pass along with the query
+            batch_size (int, optional): number of rows fetched per round trip,
+                                        defaults to 1000
+
+        Yields:
+            psycopg2.extras.DictRow: rows returned by the query
+        """
+        # Held cursors are required as named cursors can't be used in autocommit
+        cursor = self.connection.cursor(
+            f"stream_{uuid4().hex}", cursor_factory=DictCursor, withhold=True
+        )
+        cursor.itersize = batch_size
+
+        try:
+            cursor.execute(query, params)
+            yield from cursor
+        finally:
+            cursor.close()
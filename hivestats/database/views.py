@@ -0,0 +1,163 @@
+from psycopg2.extensions import AsIs
+
+from ..metrics import metric_names, metric_sql
+from .sql import Postgres
+
+STAT_COLUMNS = {  # Raw stats of each game that period views take the difference of
+    "bp": (
+        "victories",
+        "total_points",
+        "total_eliminations",
+        "total_placing",
+        "games_played",
+    ),
+}
+
+
+def all_view_sql(game="bp"):
+    """Returns the query of the all time view of a game, which reads the metrics
+    stored alongside the stats
+
+    Args:
+        game (str, optional): identifier for game, defaults to bp
+
+    Returns:
+        str: the query
+    """
+    columns = ", ".join(STAT_COLUMNS[game] + ("username",) + metric_names(game))
+
+    return f"""
+        select human_index as position, uuid, {columns}
+        from {game}_all
+        order by position
+    """
+
+
+def period_view_sql(game, period):
+    """Returns the query of a period view of a game, which computes the metrics of
+    the stats gained since the period's table was cached
+
+    Period views are materialized, so the query only runs when they are refreshed
+    and reads are served from the stored rows and metrics.
+
+    Args:
+        game (str): identifier for game
+        period (str): period of the view, such as daily
+
+    Returns:
+        str: the query
+    """
+    differences = ",\n".join(
+        f"(current.{column} - cached.{column}) as {column}"
+        for column in STAT_COLUMNS[game]
+    )
+
+    return f"""
+        select row_number() over (order by total_points desc) as position,
+               windowed.*,
+               {metric_sql(game, "windowed")}
+        from (
+            select current.uuid,
+                   {differences},
+                   current.username
+            from {game}_all current, {game}_{period} cached
+            where current.uuid = cached.uuid
+        ) windowed
+    """
+
+
+def view_statements(game, period):
+    """Returns the statements creating a view of a game
+
+    Args:
+        game (str): identifier for game
+        period (str): period of the view, all is the all time view
+
+    Returns:
+        Tuple[str]: the statements, in the order they have to be run
+    """
+    view = f"{game}_{period}_view"
+
+    if period == "all":
+        return (f"create view {view} as {all_view_sql(game)};",)
+
+    # The unique index is required to refresh the view without blocking reads
+    return (
+        f"create materialized view {view} as {period_view_sql(game, period)};",
+        f"create unique index {view}_uuid_index on {view} (uuid);",
+    ) + tuple(
+        f"create index {view}_{name}_index on {view} ({name});"
+        for name in metric_names(game)
+    )
+
+
+def drop_views(database: Postgres, game, periods):
+    """Drops period views of a game, which is required before the tables they read
+    from can be dropped
+
+    Args:
+        database (Postgres): interface to interact with the database
+        game (str): identifier for game
+        periods (Tuple[str]): periods to drop views of, all is the all time view
+    """
+    # Period views used to be plain views, so each is dropped as the kind it is
+    database.cursor.execute(
+        """
+            select relname, relkind from pg_class
+                where relname = any(%(views)s)
+                    and relkind in ('v', 'm')
+                    and pg_table_is_visible(oid);
+        """,
+        {"views": [f"{game}_{period}_view" for period in periods]},
+    )
+
+    for row in database.cursor.fetchall():
+        database.cursor.execute(
+            """
+                drop %(kind)s %(view)s;
+            """,
+            {
+                "kind": AsIs("materialized view" if row["relkind"] == "m" else "view"),
+                "view": AsIs(row["relname"]),
+            },
+        )
+
+
+def create_views(database: Postgres, game, periods):
+    """Recreates every period view of a game
+
+    Args:
+        database (Postgres): interface to interact with the database
+        game (str): identifier for game
+        periods (Tuple[str]): periods to create views for, all is the all time view
+    """
+    # Views are dropped first as replacing one can not change its columns
+    drop_views(database, game, periods)
+
+    for period in periods:
+        for statement in view_statements(game, period):
+            database.cursor.execute(statement)
+
+    # Statements prepared on this connection selected from the old views, other
+    # connections prepare theirs again the first time they fail
+    database.deallocate()
+
+
+def refresh_views(database: Postgres, game, periods):
+    """Recomputes the stored rows and metrics of period views of a game, which is
+    required after the tables they read from changed
+
+    Args:
+        database (Postgres): interface to interact with the database
+        game (str): identifier for game
+        periods (Tuple[str]): periods to refresh, the all time view is not stored
+                              and skipped
+    """
+    for period in periods:
+        if period != "all":
+            database.cursor.execute(
+                """
+                    refresh materialized view concurrently %(view)s;
+                """,
+                {"view": AsIs(f"{game}_{period}_view")},
+            )
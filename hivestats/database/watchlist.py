@@ -0,0 +1,92 @@
+from psycopg2.extensions import AsIs
+
+from .sql import Postgres
+
+WATCHLIST_TABLE = "watchlist"  # Stores the players each channel is watching
+WATCHLIST_COLUMNS = ("subscription", "channel_id", "uuid", "rule", "threshold")
+
+
+def subscription_key(channel_id, uuid, rule):
+    """Returns the unique key identifying a subscription"""
+    return f"{channel_id}:{uuid}:{rule}"
+
+
+def query_subscriptions(database: Postgres, channel_id=None):
+    """Returns stored subscriptions
+
+    Args:
+        database (Postgres): interface to interact with the database
+        channel_id (int, optional): only return subscriptions of this channel
+
+    Returns:
+        Tuple(dict): the subscriptions
+    """
+    database.cursor.execute(
+        """
+            select %(columns)s from %(table)s
+                where %(channel_id)s is null or channel_id = %(channel_id)s
+                order by channel_id, uuid, rule;
+        """,
+        {
+            "columns": AsIs(", ".join(WATCHLIST_COLUMNS)),
+            "table": AsIs(WATCHLIST_TABLE),
+            "channel_id": channel_id,
+        },
+    )
+
+    return database.cursor.fetchall()
+
+
+def add_subscription(database: Postgres, channel_id, uuid, rule, threshold):
+    """Stores a subscription, replacing the threshold of an existing one
+
+    Args:
+        database (Postgres): interface to interact with the database
+        channel_id (int): channel notifications are sent to
+        uuid (str): id of the watched player
+        rule (str): name of the rule notifications are sent for
+        threshold (int): parameter of the rule
+    """
+    database.insert(
+        WATCHLIST_TABLE,
+        WATCHLIST_COLUMNS,
+        (
+            (
+                subscription_key(channel_id, uuid, rule),
+                channel_id,
+                uuid,
+                rule,
+                threshold,
+            ),
+        ),
+        conflict_key=WATCHLIST_COLUMNS[0],
+    )
+
+
+def remove_subscriptions(database: Postgres, channel_id, uuid, rule=None):
+    """Removes subscriptions of a channel to a player
+
+    Args:
+        database (Postgres): interface to interact with the database
+        channel_id (int): channel to remove subscriptions of
+        uuid (str): id of the watched player
+        rule (str, optional): only remove the subscription for this rule
+
+    Returns:
+        int: number of removed subscriptions
+    """
+    database.cursor.execute(
+        """
+            delete from %(table)s
+                where channel_id = %(channel_id)s and uuid = %(uuid)s
+                and (%(rule)s is null or rule = %(rule)s);
+        """,
+        {
+            "table": AsIs(WATCHLIST_TABLE),
+            "channel_id": channel_id,
+            "uuid": uuid,
+            "rule": rule,
+        },
+    )
+
+    return database.cursor.rowcount
@@ -0,0 +1,286 @@
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+from decimal import Decimal
+from itertools import islice
+
+from .database import Postgres
+from .database import leaderboard as db_lb
+from .database.names import NAME_COLUMNS, NAME_TABLE
+
+FORMATS = ("csv", "jsonl", "parquet")
+HISTORY_TABLE = "bp_history"
+HISTORY_COLUMNS = (
+    "snapshot_at",
+    "uuid",
+    "human_index",
+    "victories",
+    "total_points",
+    "total_eliminations",
+    "total_placing",
+    "games_played",
+)
+BATCH_SIZE = 1000  # Number of rows fetched from the database and written at a time
+
+
+def leaderboard_source(
+    game="bp", period="all", sort_by="total_points", sort_order="desc"
+):
+    """Returns the query used to export a cached leaderboard
+
+    Args:
+        game (str, optional): identifier for game, defaults to bp
+        period (str, optional): period of the leaderboard, defaults to all time
+        sort_by (str, optional): column to sort rows by, defaults to points
+        sort_order (str, optional): whether to sort asc or desc, defaults to desc
+
+    Raises:
+        ValueError: if any of the parameters is not a known game, period, column
+                    or order
+
+    Returns:
+        Tuple[str]: names of the exported columns
+        str: the query
+        dict: parameters for the query
+    """
+    if (
+        game not in db_lb.GAMES
+        or period not in db_lb.PERIODS
+        or sort_by not in db_lb.SORT_COLUMNS
+        or sort_order not in db_lb.SORT_ORDERS
+    ):
+        raise ValueError(f"Invalid export: {game}, {period}, {sort_by}, {sort_order}")
+
+    columns = ("row_num",) + db_lb.STATS_COLUMNS
+    query = f"""
+        select row_number() over (order by {sort_by} {sort_order}) as row_num,
+               {", ".join(db_lb.STATS_COLUMNS)}
+            from {game}_{period}_view
+            order by row_num;
+    """
+
+    return columns, query, {}
+
+
+def names_source(uuid=None):
+    """Returns the query used to export stored name histories
+
+    Args:
+        uuid (str, optional): only export the history of this player
+
+    Returns:
+        Tuple[str]: names of the exported columns
+        str: the query
+        dict: parameters for the query
+    """
+    where = "where uuid = %(uuid)s" if uuid else ""
+    query = f"""
+        select {", ".join(NAME_COLUMNS)} from {NAME_TABLE}
+            {where}
+            order by uuid, position;
+    """
+
+    return NAME_COLUMNS, query, {"uuid": uuid}
+
+
+def history_source(uuid=None, since=None, until=None):
+    """Returns the query used to export a range of leaderboard history
+
+    Args:
+        uuid (str, optional): only export the history of this player
+        since (datetime, optional): only export snapshots taken from this time
+        until (datetime, optional): only export snapshots taken before this time
+
+    Returns:
+        Tuple[str]: names of the exported columns
+        str: the query
+        dict: parameters for the query
+    """
+    conditions = [
+        condition
+        for condition, value in (
+            ("uuid = %(uuid)s", uuid),
+            ("snapshot_at >= %(since)s", since),
+            ("snapshot_at < %(until)s", until),
+        )
+        if value
+    ]
+    where = "where {}".format(" and ".join(conditions)) if conditions else ""
+    query = f"""
+        select {", ".join(HISTORY_COLUMNS)} from {HISTORY_TABLE}
+            {where}
+            order by snapshot_at, human_index;
+    """
+
+    return HISTORY_COLUMNS, query, {"uuid": uuid, "since": since, "until": until}
+
+
+SOURCES = {
+    "leaderboard": leaderboard_source,
+    "names": names_source,
+    "history": history_source,
+}
+
+
+def plain_value(value):
+    """Converts database values to types supported by every export format"""
+    if isinstance(value, Decimal):
+        return float(value)
+
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    return value
+
+
+def batches(rows, columns, size=BATCH_SIZE):
+    """Groups rows into batches of plain tuples
+
+    Args:
+        rows (Iterable[dict]): rows to group
+        columns (Tuple[str]): columns to take from each row, in order
+        size (int, optional): max number of rows per batch
+
+    Yields:
+        List[Tuple]: the next batch of rows
+    """
+    rows = iter(rows)
+
+    while True:
+        batch = [
+            tuple(plain_value(row[column]) for column in columns)
+            for row in islice(rows, size)
+        ]
+
+        if not batch:
+            return
+
+        yield batch
+
+
+def write_csv(rows, columns, file):
+    """Writes rows to a binary file as csv with a header row"""
+    text = io.TextIOWrapper(file, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(columns)
+
+    for batch in batches(rows, columns):
+        writer.writerows(batch)
+
+    text.flush()
+    text.detach()
+
+
+def write_jsonl(rows, columns, file):
+    """Writes rows to a binary file as one json object per line"""
+    text = io.TextIOWrapper(file, encoding="utf-8")
+
+    for batch in batches(rows, columns):
+        text.writelines(json.dumps(dict(zip(columns, row))) + "\n" for row in batch)
+
+    text.flush()
+    text.detach()
+
+
+def write_parquet(rows, columns, file):
+    """Writes rows to a binary file as parquet, requires pyarrow"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet exports require pyarrow to be installed")
+
+    writer = None
+
+    # Every batch is written as its own row group
+    for batch in batches(rows, columns):
+        data = {column: list(values) for column, values in zip(columns, zip(*batch))}
+
+        if writer is None:
+            table = pyarrow.Table.from_pydict(data)
+            writer = pyarrow.parquet.ParquetWriter(file, table.schema)
+        else:
+            table = pyarrow.Table.from_pydict(data, schema=writer.schema)
+
+        writer.write_table(table)
+
+    if writer is not None:
+        writer.close()
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "parquet": write_parquet}
+
+
+def export(database: Postgres, file, fmt="csv", source="leaderboard", **options):
+    """Streams data from the database into a file in the requested format
+
+    Args:
+        database (Postgres): interface to interact with the database
+        file (BinaryIO): file to write the export to
+        fmt (str, optional): one of csv, jsonl or parquet, defaults to csv
+        source (str, optional): one of leaderboard, names or history, defaults to
+                                leaderboard
+        options: passed to the source to select the exported data
+
+    Raises:
+        ValueError: if the format, source or options are invalid
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    if source not in SOURCES:
+        raise ValueError(f"Unknown export source: {source}")
+
+    columns, query, params = SOURCES[source](**options)
+    rows = database.stream(query, params, batch_size=BATCH_SIZE)
+
+    WRITERS[fmt](rows, columns, file)
+
+
+def parse_date(value):
+    """Parses a YYYY-MM-DD date given on the command line"""
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m hivestats.export",
+        description="Export cached leaderboards, name histories or history",
+    )
+    parser.add_argument("source", choices=SOURCES)
+    parser.add_argument("-f", "--format", choices=FORMATS, default="csv")
+    parser.add_argument("-o", "--output", help="file to write to, stdout by default")
+    parser.add_argument("--game", default="bp")
+    parser.add_argument("--period", default="all", choices=db_lb.PERIODS)
+    parser.add_argument("--sort-by", default="total_points", choices=db_lb.SORT_COLUMNS)
+    parser.add_argument("--sort-order", default="desc", choices=db_lb.SORT_ORDERS)
+    parser.add_argument("--uuid", help="only export the history of this player")
+    parser.add_argument("--since", type=parse_date, help="start of history, UTC")
+    parser.add_argument("--until", type=parse_date, help="end of history, UTC")
+    args = parser.parse_args(args)
+
+    if args.source == "leaderboard":
+        options = {
+            "game": args.game,
+            "period": args.period,
+            "sort_by": args.sort_by,
+            "sort_order": args.sort_order,
+        }
+    elif args.source == "history":
+        options = {"uuid": args.uuid, "since": args.since, "until": args.until}
+    else:
+        options = {"uuid": args.uuid}
+
+    with Postgres() as database:
+        if args.output:
+            with open(args.output, "wb") as file:
+                export(database, file, args.format, args.source, **options)
+        else:
+            export(database, sys.stdout.buffer, args.format, args.source, **options)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+from collections import defaultdict
+
+from .database import guilds as db_guilds
+
+MAX_MEMBERS = 1000  # Max number of players registered to a guild
+
+
+class GuildRegistry:
+    """Players registered to each guild and their rankings among each other
+
+    Members are loaded from the database the first time a guild is used and kept
+    in memory afterwards. Rankings are derived from the cached leaderboard once
+    per snapshot version and change of membership, only for guilds that ask for
+    them, and fall back to a single query when the leaderboard is not cached.
+
+    Args:
+        database (Postgres): interface to interact with the database
+        cache (LeaderboardCache): the bot's leaderboard cache
+    """
+
+    def __init__(self, database, cache):
+        self.database = database
+        self.cache = cache
+        self._members = {}
+        self._revisions = defaultdict(int)
+        self._orders = {}
+
+    def members(self, guild_id):
+        """Returns the players registered to a guild
+
+        Args:
+            guild_id (int): id of the guild
+
+        Returns:
+            Set[str]: uuids of the registered players
+        """
+        if guild_id not in self._members:
+            self._members[guild_id] = set(
+                db_guilds.query_members(self.database, guild_id)
+            )
+
+        return self._members[guild_id]
+
+    def register(self, guild_id, uuid):
+        """Registers a player to a guild
+
+        Returns:
+            bool: whether the player was not registered yet
+        """
+        members = self.members(guild_id)
+
+        if uuid in members:
+            return False
+
+        db_guilds.add_member(self.database, guild_id, uuid)
+        members.add(uuid)
+        self._revisions[guild_id] += 1
+        return True
+
+    def unregister(self, guild_id, uuid):
+        """Unregisters a player from a guild
+
+        Returns:
+            bool: whether the player was registered
+        """
+        members = self.members(guild_id)
+
+        if uuid not in members:
+            return False
+
+        db_guilds.remove_member(self.database, guild_id, uuid)
+        members.discard(uuid)
+        self._revisions[guild_id] += 1
+        return True
+
+    def _ranking(self, guild_id, view, column):
+        def rank(views):
+            if view not in views:
+                return None
+
+            # Starting from the previous order makes the sort close to linear, as
+            # few players change places between refreshes
+            previous = self._orders.get((guild_id, view, column), ())
+            order = [uuid for uuid in previous if uuid in members]
+            order += members.difference(order)
+            players = (self.cache.player(view, uuid) for uuid in order)
+            ranking = sorted(
+                (player for player in players if player),
+                key=lambda player: player[column],
+                reverse=True,
+            )
+            self._orders[guild_id, view, column] = [row["uuid"] for row in ranking]
+
+            return ranking
+
+        members = self.members(guild_id)
+
+        # Memoized rankings are dropped with the snapshot they were derived from
+        return self.cache.memoize(
+            ("guild", guild_id, self._revisions[guild_id], view, column), rank
+        )
+
+    def leaderboard(
+        self, guild_id, start, length=1, sort_by="total_points", period="all"
+    ):
+        """Returns leaderboard entries of the players registered to a guild, ranked
+        among each other
+
+        Args:
+            guild_id (int): id of the guild
+            start (int): index of the first entry to get
+            length (int, optional): number of entries to get, defaults to 1
+            sort_by (str, optional): column to sort by, defaults to total_points
+            period (str, optional): period of the leaderboard, defaults to all time
+
+        Returns:
+            Tuple(dict): leaderboard entries numbered by row_num
+        """
+        self.cache.refresh()
+        ranking = self._ranking(guild_id, f"bp_{period}_view", sort_by)
+
+        if ranking is None:
+            return db_guilds.query_guild_leaderboard(
+                self.database, guild_id, start, length, sort_by, period=period
+            )
+
+        return tuple(
+            dict(row, row_num=row_num)
+            for row_num, row in enumerate(ranking[start : start + length], start + 1)
+        )
+
+    def count(self, guild_id, period="all"):
+        """Returns the number of registered players with stats for a period"""
+        ranking = self._ranking(guild_id, f"bp_{period}_view", "total_points")
+
+        if ranking is None:
+            return len(self.members(guild_id))
+
+        return len(ranking)
@@ -1 +1,6 @@
-from .hive_interface import player_data, leaderboard
+from .hive_interface import (
+    HiveAPIError,
+    player_data,
+    player_data_many,
+    leaderboard,
+)
@@ -1,8 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
 import requests
 
+from ..circuit_breaker import CircuitBreaker, UpstreamUnavailable
+
 
 base = "http://api.hivemc.com/v1/{}".format
 
+MAX_WORKERS = 10  # Max number of concurrent requests made for batch lookups
+REQUEST_TIMEOUT = 5  # Seconds to wait for the api before giving up on a request
+
+
+class HiveAPIError(UpstreamUnavailable):
+    """Raised when the Hive api fails to respond or responds with an error"""
+
+
+breaker = CircuitBreaker("The Hive API", exceptions=(HiveAPIError,))
+
+
+def parse_object(data):
+    """Returns the data of a response that should hold a single object"""
+    if not isinstance(data, dict):
+        raise TypeError(f"Expected an object, got {type(data).__name__}")
+
+    return data
+
+
+@breaker
+def get(url, parse=parse_object):
+    """Requests a url from the api and parses the response, failures of either are
+    tracked by the circuit breaker
+
+    Args:
+        url (str): url to request
+        parse (Callable, optional): returns the data of a successful response from
+                                    its json, raising ValueError, KeyError,
+                                    TypeError or IndexError if it is malformed,
+                                    defaults to checking it is an object
+
+    Raises:
+        HiveAPIError: if the api could not be reached, had a server error or
+                      responded with malformed data
+        CircuitOpenError: if the api has been failing and is not being called
+
+    Returns:
+        Any or bool: the parsed data or False if the api responded with an error
+    """
+    try:
+        r = requests.get(url, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException as error:
+        raise HiveAPIError(str(error))
+
+    if r.status_code >= 500:
+        raise HiveAPIError(f"{url} returned {r.status_code}")
+
+    if not r.ok:
+        return False
+
+    try:
+        return parse(r.json())
+    except (ValueError, KeyError, TypeError, IndexError):
+        raise HiveAPIError(f"{url} returned a malformed response")
+
 
 def player_data(uuid, game=""):
     """Returns data of specified player
@@ -12,12 +72,40 @@ def player_data(uuid, game=""):
         game (str, optional): if provided, returns player stats for specified
             game else returns general Hive info on player
 
+    Raises:
+        UpstreamUnavailable: if the api is currently unavailable or returned an
+                             unexpected response
+
     Returns:
         dict or bool: serialized data for player or False if request failed
     """
-    r = requests.get(base("player/{}/{}".format(uuid, game)))
+    return get(base("player/{}/{}".format(uuid, game)))
+
+
+def player_data_many(uuids, game=""):
+    """Returns data of several players, requesting them concurrently
+
+    Args:
+        uuids (Iterable[str]): ids of players to retrieve data for
+        game (str, optional): if provided, returns player stats for specified
+            game else returns general Hive info on player
 
-    return r.json() if r.ok else False
+    Raises:
+        UpstreamUnavailable: if the api is currently unavailable
+
+    Returns:
+        dict: mapping of uuid to serialized data for player or False if the
+              request for that player failed
+    """
+    uuids = list(dict.fromkeys(uuids))
+
+    if not uuids:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(uuids))) as executor:
+        results = executor.map(partial(player_data, game=game), uuids)
+
+    return dict(zip(uuids, results))
 
 
 def leaderboard(game, start, length=1):
@@ -33,13 +121,26 @@ def leaderboard(game, start, length=1):
         start is within [0, 1000]
         length <= 200
 
+    Raises:
+        UpstreamUnavailable: if the api is currently unavailable or returned an
+                             unexpected response
+
     Returns:
         list(dict) or dict: list of leaderboard entries
     """
     end = min(1000, start + length)
-    r = requests.get(base("game/{}/leaderboard/{}/{}".format(game, start, end)))
 
-    if length == 1:
-        return r.json()["leaderboard"][0]
+    def parse(data):
+        entries = data["leaderboard"]
+
+        if not isinstance(entries, list):
+            raise TypeError(f"Expected a list of entries, got {type(entries).__name__}")
+
+        return entries[0] if length == 1 else entries
+
+    entries = get(base("game/{}/leaderboard/{}/{}".format(game, start, end)), parse)
+
+    if entries is False:
+        raise HiveAPIError(f"Invalid leaderboard request for {game}")
 
-    return r.json()["leaderboard"]
+    return entries
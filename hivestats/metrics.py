@@ -0,0 +1,106 @@
+from array import array
+from typing import NamedTuple
+
+
+class Metric(NamedTuple):
+    name: str
+    numerator: str
+    denominator: str
+
+
+METRICS = {  # Metrics derived from the raw stats of each game
+    "bp": (
+        Metric("win_rate", "victories", "games_played"),
+        Metric("placing_rate", "total_placing", "games_played"),
+        Metric("points_per_game", "total_points", "games_played"),
+    ),
+}
+METRIC_TYPE = "double precision"  # Postgres type of stored metric columns
+
+
+def ratio(numerator, denominator):
+    """Divides two stats, players without games played have a ratio of 0"""
+    return numerator / denominator if denominator else 0.0
+
+
+def metric_names(game="bp"):
+    """Returns the names of the metrics derived for a game
+
+    Args:
+        game (str, optional): identifier for game, defaults to bp
+
+    Returns:
+        Tuple[str]: the metric names
+    """
+    return tuple(metric.name for metric in METRICS.get(game.lower(), ()))
+
+
+def compute_metrics(columns, game="bp"):
+    """Computes every metric of a game for whole columns at once
+
+    Args:
+        columns (dict): mapping of stat name to a sequence of that stat's values
+        game (str, optional): identifier for game, defaults to bp
+
+    Returns:
+        dict: mapping of metric name to an array of that metric's values
+    """
+    return {
+        metric.name: array(
+            "d", map(ratio, columns[metric.numerator], columns[metric.denominator])
+        )
+        for metric in METRICS.get(game.lower(), ())
+    }
+
+
+def add_metrics(stats, game="bp"):
+    """Adds the metrics of a game to the stats of a single player
+
+    Args:
+        stats (dict): player stats for a game, modified in place
+        game (str, optional): identifier for game, defaults to bp
+
+    Returns:
+        dict: the same stats with every metric added
+    """
+    for metric in METRICS.get(game.lower(), ()):
+        stats[metric.name] = ratio(stats[metric.numerator], stats[metric.denominator])
+
+    return stats
+
+
+def metric_expressions(game="bp", alias=None):
+    """Returns the Postgres expressions computing the metrics of a game
+
+    Args:
+        game (str, optional): identifier for game, defaults to bp
+        alias (str, optional): alias of the relation the stats are selected from
+
+    Returns:
+        dict: mapping of metric name to the expression computing it
+    """
+    prefix = f"{alias}." if alias else ""
+
+    return {
+        metric.name: f"case {prefix}{metric.denominator} when 0 then 0 "
+        f"else {prefix}{metric.numerator}::{METRIC_TYPE} "
+        f"/ {prefix}{metric.denominator} end"
+        for metric in METRICS.get(game.lower(), ())
+    }
+
+
+def metric_sql(game="bp", alias=None):
+    """Returns the select expressions computing the metrics of a game in Postgres,
+    used for views whose stats are not stored in a table
+
+    Args:
+        game (str, optional): identifier for game, defaults to bp
+        alias (str, optional): alias of the relation the stats are selected from
+
+    Returns:
+        str: comma separated select expressions
+    """
+    return ",\n".join(
+        f"{expression} as {name}"
+        for name, expression in metric_expressions(game, alias).items()
+    )
@@ -0,0 +1,432 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime
+from hashlib import md5
+from types import SimpleNamespace
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .analytics import ColumnDistribution
+from .content_functions import get_rank
+from .traffic import read_events
+
+LATENCY = 0.05  # Seconds the fake apis take to respond
+DRAIN = 5  # Seconds in flight commands get to finish after the last event
+SAMPLE_FREQ = 0.01  # Frequency at which the scheduler's queue depth is sampled
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+def fake_uuid(username):
+    """Returns the uuid the fake apis give a username"""
+    return md5(username.lower().encode()).hexdigest()
+
+
+class FakeUpstream:
+    """Answers requests to the Hive and Mojang apis with deterministic players,
+    installed in place of the requests transport adapter
+
+    Args:
+        latency (float, optional): seconds each request takes
+        error_rate (float, optional): share of requests failing with a 503
+        seed (int, optional): seed of the generated stats and errors
+    """
+
+    def __init__(self, latency=LATENCY, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._names = {}
+        self._leaderboard = None
+        self._original = None
+
+    def install(self):
+        self._original = HTTPAdapter.send
+        upstream = self
+
+        def send(adapter, request, **kwargs):
+            return upstream.send(request)
+
+        HTTPAdapter.send = send
+
+    def uninstall(self):
+        HTTPAdapter.send = self._original
+
+    def username(self, uuid):
+        return self._names.get(uuid, f"Player{uuid[:8]}")
+
+    def uuid(self, username):
+        uuid = fake_uuid(username)
+        self._names.setdefault(uuid, username)
+        return uuid
+
+    def stats(self, uuid):
+        rng = random.Random(f"{self.seed}:{uuid}")
+        played = rng.randint(0, 20000)
+        victories = rng.randint(0, played // 4)
+        points = played * rng.randint(5, 40)
+
+        return {
+            "victories": victories,
+            "total_points": points,
+            "total_eliminations": played - victories,
+            "total_placing": min(played, victories * 3),
+            "games_played": played,
+            "title": get_rank(points),
+        }
+
+    def player(self, uuid):
+        now = int(time.time())
+        last_login = now - random.Random(uuid).randint(60, 86400)
+
+        return {
+            "UUID": uuid,
+            "username": self.username(uuid),
+            "lastLogin": last_login,
+            "lastLogout": last_login + 30,
+            "status": {"description": "Currently hanging out in the", "game": "Lobby"},
+            "modernRank": {"human": "Regular"},
+        }
+
+    def leaderboard(self, start, end):
+        if self._leaderboard is None:
+            self._leaderboard = sorted(
+                (fake_uuid(f"Player{index}") for index in range(1000)),
+                key=lambda uuid: -self.stats(uuid)["total_points"],
+            )
+
+        uuids = self._leaderboard
+        entries = []
+
+        for index in range(start, end):
+            stats = self.stats(uuids[index])
+            stats.pop("title")
+            entries.append(
+                dict(
+                    index=index,
+                    human_index=index + 1,
+                    UUID=uuids[index],
+                    **stats,
+                    username=self.username(uuids[index]),
+                )
+            )
+
+        return {"leaderboard": entries}
+
+    def route(self, request):
+        parts = request.path_url.split("?")[0].strip("/").split("/")
+
+        if "hivemc" in request.url:
+            if parts[1] == "player":
+                if len(parts) > 3:
+                    return self.stats(parts[2])
+
+                return self.player(parts[2])
+
+            return self.leaderboard(int(parts[4]), int(parts[5]))
+
+        if request.method == "POST":
+            names = json.loads(request.body)
+            return [{"id": self.uuid(name), "name": name} for name in names]
+
+        if parts[0] == "users":
+            return {"id": self.uuid(parts[-1]), "name": parts[-1]}
+
+        return [{"name": self.username(parts[2])}]
+
+    def send(self, request):
+        self.requests += 1
+        time.sleep(self.latency)
+
+        response = requests.Response()
+        response.url = request.url
+        response.request = request
+
+        if self._random.random() < self.error_rate:
+            response.status_code = 503
+            response._content = b""
+        else:
+            response.status_code = 200
+            response._content = json.dumps(self.route(request)).encode()
+            response.headers["Content-Type"] = "application/json"
+
+        return response
+
+
+class FakeMessage:
+    _ids = iter(range(1, 2 ** 62))
+
+    def __init__(self, replay, channel, invocation):
+        self.id = next(self._ids)
+        self.channel = channel
+        self.invocation = invocation
+        self.created_at = datetime.utcnow()
+        self._replay = replay
+        self._reacted_at = None
+
+    async def edit(self, **kwargs):
+        if self._reacted_at is not None:
+            self._replay.reaction_latencies.append(time.monotonic() - self._reacted_at)
+            self._reacted_at = None
+
+    async def add_reaction(self, emoji):
+        self._replay.reactable[self.invocation] = self
+
+    async def remove_reaction(self, emoji, member):
+        pass
+
+    async def clear_reactions(self):
+        pass
+
+
+class FakeContext:
+    """Stands in for a discord context with the attributes used by commands"""
+
+    def __init__(self, replay, event):
+        self._replay = replay
+        self.command = SimpleNamespace(qualified_name=event["command"])
+        self.args = [self] + event["args"]
+        self.kwargs = event["kwargs"]
+        self.author = SimpleNamespace(id=event["user"], avatar_url="")
+        self.guild = (
+            SimpleNamespace(id=event["guild"], name="Replay")
+            if event["guild"]
+            else None
+        )
+        self.channel = SimpleNamespace(
+            id=event["channel"], type="text" if self.guild else "private"
+        )
+        self.recorded = event["invocation"]  # admit_command sets its own invocation
+        self.started = time.monotonic()
+        self.responded = None
+
+    async def send(self, content=None, **kwargs):
+        if self.responded is None:
+            self.responded = time.monotonic()
+            self._replay.command_latencies.append(self.responded - self.started)
+
+        return FakeMessage(self._replay, self.channel, self.recorded)
+
+
+class Replay:
+    """Drives the bot's command handlers with recorded traffic
+
+    The Hive and Mojang apis are replaced by FakeUpstream and Discord by fake
+    contexts and messages. Replayed commands still write to the database, such as
+    name histories of fake players and watchlist subscriptions, so it has to be a
+    separate replay database.
+
+    Args:
+        bot (module): the bot module, with its client, hooks and caches
+        events (List[dict]): recorded events, see hivestats.traffic
+        speed (float, optional): how many times faster than recorded to replay
+    """
+
+    def __init__(self, bot, events, speed=1.0):
+        self.bot = bot
+        self.events = events
+        self.speed = speed
+        self.commands = 0
+        self.reactions = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.command_latencies = []
+        self.reaction_latencies = []
+        self.reactable = {}
+        self._contexts = {}
+        self._waiters = []
+
+    async def wait_for(self, event, *, check=None, timeout=None):
+        """Stands in for client.wait_for, resolving every waiter on a reaction"""
+        future = asyncio.get_event_loop().create_future()
+        self._waiters.append(future)
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            if future in self._waiters:
+                self._waiters.remove(future)
+
+    async def invoke(self, event):
+        ctx = FakeContext(self, event)
+        self._contexts[event["invocation"]] = ctx
+        command = self.bot.client.get_command(event["command"])
+        self.commands += 1
+
+        try:
+            try:
+                await self.bot.admit_command(ctx)
+            except Exception as error:
+                await self.bot.on_command_error(ctx, error)
+                return
+
+            try:
+                await command.callback(ctx, *event["args"], **event["kwargs"])
+            except Exception as error:
+                await self.bot.on_command_error(ctx, error)
+            finally:
+                await self.bot.release_command(ctx)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.errors += 1
+
+    async def react(self, event, timeout):
+        # Waits for the message to be sent and its reaction interface to listen,
+        # as a sped up replay can reach the reaction before the handler does
+        deadline = time.monotonic() + timeout
+
+        while (
+            event["invocation"] not in self.reactable or not self._waiters
+        ) and time.monotonic() < deadline:
+            await asyncio.sleep(SAMPLE_FREQ)
+
+        message = self.reactable.get(event["invocation"])
+        ctx = self._contexts.get(event["invocation"])
+
+        if message is None or ctx is None:
+            return
+
+        self.reactions += 1
+        message._reacted_at = time.monotonic()
+        payload = SimpleNamespace(
+            message_id=message.id,
+            user_id=ctx.author.id,
+            emoji=SimpleNamespace(name=event["emoji"]),
+        )
+        waiters, self._waiters = self._waiters, []
+
+        for future in waiters:
+            if not future.done():
+                future.set_result(payload)
+
+    async def sample(self):
+        while True:
+            self.max_queue_depth = max(
+                self.max_queue_depth, self.bot.scheduler.queue_depth
+            )
+            await asyncio.sleep(SAMPLE_FREQ)
+
+    async def run(self, drain=DRAIN):
+        """Replays every event at its recorded offset, divided by speed"""
+        self.bot.client.wait_for = self.wait_for
+        loop = asyncio.get_event_loop()
+        tasks = [asyncio.ensure_future(self.sample())]
+        start, first = loop.time(), self.events[0]["at"] if self.events else 0
+
+        for event in self.events:
+            delay = start + (event["at"] - first) / self.speed - loop.time()
+
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            if event["kind"] == "command":
+                tasks.append(asyncio.ensure_future(self.invoke(event)))
+            else:
+                tasks.append(asyncio.ensure_future(self.react(event, drain)))
+
+        # Reaction interfaces wait for minutes, so they are cut off after draining
+        await asyncio.sleep(drain)
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def report(self):
+        """Returns a summary of the replay
+
+        Returns:
+            str: the summary
+        """
+        flights, scheduler = self.bot.flights, self.bot.scheduler
+        shared = flights.hits + flights.misses
+        lines = [
+            f"Commands: {self.commands}, reactions: {self.reactions}, "
+            f"unhandled errors: {self.errors}",
+            f"Flights: {flights.hits} hits, {flights.misses} misses "
+            f"({flights.hits / shared if shared else 0:.1%} hit rate)",
+            f"Scheduler: {scheduler.admitted} admitted, {scheduler.shed} shed, "
+            f"max queue depth {self.max_queue_depth}",
+        ]
+
+        for name, latencies in (
+            ("Command", self.command_latencies),
+            ("Reaction", self.reaction_latencies),
+        ):
+            distribution = ColumnDistribution(latencies)
+
+            if not distribution.count:
+                continue
+
+            lines.append(
+                f"{name} latency: "
+                + ", ".join(
+                    f"p{round(q * 100)} {distribution.quantile(q) * 1000:.0f}ms"
+                    for q in PERCENTILES
+                )
+                + f", max {distribution.values[-1] * 1000:.0f}ms"
+            )
+
+        return "\n".join(lines)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m hivestats.replay",
+        description="Replay recorded traffic against fake Hive, Mojang and Discord, "
+        "run from the repository root",
+    )
+    parser.add_argument("log", help="file traffic was recorded to")
+    parser.add_argument("-s", "--speed", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=LATENCY)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--drain", type=float, default=DRAIN)
+    parser.add_argument(
+        "--database-url",
+        default=os.environ.get("REPLAY_DATABASE_URL"),
+        help="database replayed commands read and write, defaults to "
+        "REPLAY_DATABASE_URL, must not be the production DATABASE_URL",
+    )
+    args = parser.parse_args(args)
+
+    if not args.database_url:
+        parser.error("a replay database is required, see --database-url")
+
+    if args.database_url == os.environ.get("DATABASE_URL"):
+        parser.error("the replay database must not be the production database")
+
+    # Replayed commands write fake names and subscriptions, so they never get to
+    # the production database
+    os.environ["DATABASE_URL"] = args.database_url
+
+    # The bot reads these on import, neither is used as it never logs in
+    os.environ.setdefault("BOT_PREFIX", "!")
+    os.environ.setdefault("DISCORD_TOKEN", "")
+
+    upstream = FakeUpstream(args.latency, args.error_rate, args.seed)
+    upstream.install()
+
+    import bot
+
+    bot.recorder.path = None  # Replayed traffic is not recorded again
+    replay = Replay(bot, read_events(args.log), args.speed)
+
+    try:
+        bot.client.loop.run_until_complete(replay.run(args.drain))
+    finally:
+        upstream.uninstall()
+
+    print(replay.report())
+    print(f"Upstream requests: {upstream.requests}")
+
+
+if __name__ == "__main__":
+    main()
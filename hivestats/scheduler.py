@@ -0,0 +1,195 @@
+import asyncio
+import time
+from heapq import heappop, heappush
+from itertools import count
+
+# Priorities, lower values are served first
+INTERACTIVE = 0  # Reactions on messages that were already sent
+COMMAND = 1  # Newly invoked commands
+BACKGROUND = 2  # Work that no user is waiting on
+
+CONCURRENCY = 4  # Max number of units of work running at once
+MAX_QUEUE = 50  # Max number of units of work waiting for a slot
+MAX_WAIT = 10  # Max seconds work waits for a slot before being shed
+GUILD_QUOTA = (20, 1.0)  # Burst size and refill per second of each guild's quota
+USER_QUOTA = (5, 0.25)  # Burst size and refill per second of each user's quota
+# Separate quota for each user's reactions, which come in quick bursts while paging
+INTERACTIVE_QUOTA = (20, 2.0)
+MAX_BUCKETS = 10000  # Number of quota buckets kept before idle ones are dropped
+
+
+class Overloaded(Exception):
+    """Raised when work is shed because of a quota or a full queue"""
+
+
+class TokenBucket:
+    """Quota that allows bursts of up to size and refills at rate per second"""
+
+    def __init__(self, size, rate):
+        self.size = size
+        self.rate = rate
+        self.tokens = size
+        self.updated = time.monotonic()
+
+    @property
+    def full(self):
+        """bool: whether the bucket refilled completely"""
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.size
+
+    def take(self):
+        """Takes a token if one is available
+
+        Returns:
+            bool: whether a token was taken
+        """
+        now = time.monotonic()
+        self.tokens = min(self.size, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+        return True
+
+
+class Slot:
+    """Permission to run one unit of work, must be released once it is done"""
+
+    def __init__(self, scheduler):
+        self._scheduler = scheduler
+        self._released = False
+
+    def release(self):
+        """Releases the slot, calling this more than once has no effect"""
+        if not self._released:
+            self._released = True
+            self._scheduler._release()
+
+
+class _SlotContext:
+    def __init__(self, scheduler, *args):
+        self._scheduler = scheduler
+        self._args = args
+        self._slot = None
+
+    async def __aenter__(self):
+        self._slot = await self._scheduler.acquire(*self._args)
+        return self._slot
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self._slot.release()
+
+
+class Scheduler:
+    """Admission control for bot work, limiting concurrency and applying per guild
+    and per user quotas with a bounded priority queue for work waiting on a slot
+
+    Args:
+        concurrency (int, optional): max number of units of work running at once
+        max_queue (int, optional): max number of units of work waiting for a slot
+        max_wait (float, optional): max seconds to wait for a slot
+    """
+
+    def __init__(self, concurrency=CONCURRENCY, max_queue=MAX_QUEUE, max_wait=MAX_WAIT):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.admitted = 0
+        self.shed = 0
+        self._active = 0
+        self._waiters = []
+        self._order = count()
+        self._buckets = {}
+
+    @property
+    def queue_depth(self):
+        """int: number of units of work waiting for a slot"""
+        return sum(not future.done() for _, _, future in self._waiters)
+
+    def _within_quota(self, key, quota):
+        if key not in self._buckets:
+            if len(self._buckets) >= MAX_BUCKETS:
+                self._buckets = {
+                    key: bucket
+                    for key, bucket in self._buckets.items()
+                    if not bucket.full
+                }
+
+            self._buckets[key] = TokenBucket(*quota)
+
+        return self._buckets[key].take()
+
+    async def acquire(self, priority, guild_id=None, user_id=None):
+        """Waits for a slot to run a unit of work
+
+        Args:
+            priority (int): one of INTERACTIVE, COMMAND or BACKGROUND
+            guild_id (int, optional): guild the work is for, quotas are not applied
+                                      to work without a guild or user
+            user_id (int, optional): user the work is for, interactive work only
+                                     draws from its own per user quota
+
+        Raises:
+            Overloaded: if a quota is exceeded, the queue is full or no slot became
+                        available in time
+
+        Returns:
+            Slot: the acquired slot
+        """
+        if priority == INTERACTIVE:
+            if user_id is not None and not self._within_quota(
+                ("interactive", user_id), INTERACTIVE_QUOTA
+            ):
+                self.shed += 1
+                raise Overloaded("Interactive quota exceeded")
+        elif priority == COMMAND:
+            if user_id is not None and not self._within_quota(
+                ("user", user_id), USER_QUOTA
+            ):
+                self.shed += 1
+                raise Overloaded("User quota exceeded")
+
+            if guild_id is not None and not self._within_quota(
+                ("guild", guild_id), GUILD_QUOTA
+            ):
+                self.shed += 1
+                raise Overloaded("Guild quota exceeded")
+
+        if self._active < self.concurrency and not self.queue_depth:
+            self._active += 1
+            self.admitted += 1
+            return Slot(self)
+
+        if self.queue_depth >= self.max_queue:
+            self.shed += 1
+            raise Overloaded("Queue is full")
+
+        future = asyncio.get_event_loop().create_future()
+        heappush(self._waiters, (priority, next(self._order), future))
+
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            raise Overloaded("Timed out waiting for a slot")
+
+        self.admitted += 1
+        return Slot(self)
+
+    def slot(self, priority, guild_id=None, user_id=None):
+        """Returns an async context manager that holds a slot while entered, see
+        acquire for the arguments
+        """
+        return _SlotContext(self, priority, guild_id, user_id)
+
+    def _release(self):
+        # The slot is handed straight to the most important waiting work
+        while self._waiters:
+            _, _, future = heappop(self._waiters)
+
+            if not future.done():
+                future.set_result(None)
+                return
+
+        self._active -= 1
@@ -0,0 +1,152 @@
+from bisect import bisect_left
+from collections import defaultdict
+from typing import NamedTuple
+
+SUGGESTION_COUNT = 5  # Number of suggestions returned for names that were not found
+MIN_SIMILARITY = 0.3  # Share of trigrams a suggestion needs to share with the query
+
+
+class IndexedName(NamedTuple):
+    name: str
+    uuid: str
+    current: bool  # False for names the player has since changed
+
+
+def trigrams(name):
+    """Returns the trigrams of a name, padded so that starts weigh more than ends
+
+    Args:
+        name (str): the name, already lowercased
+
+    Returns:
+        Set[str]: the trigrams
+    """
+    padded = f"  {name} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class UsernameIndex:
+    """In memory index of known usernames supporting exact, prefix and fuzzy lookups
+
+    Prefix lookups are a binary search over the sorted names, fuzzy lookups only
+    score names that share a trigram with the query.
+
+    Args:
+        names (Iterable[IndexedName]): names to index, current names take
+                                       precedence over old names of other players
+    """
+
+    def __init__(self, names=()):
+        self._names = {}
+
+        for entry in names:
+            key = entry.name.lower()
+
+            if key not in self._names or (
+                entry.current and not self._names[key].current
+            ):
+                self._names[key] = entry
+
+        self._sorted = sorted(self._names)
+        self._trigrams = defaultdict(list)
+        self._sizes = {}
+
+        for key in self._sorted:
+            key_trigrams = trigrams(key)
+            self._sizes[key] = len(key_trigrams)
+
+            for trigram in key_trigrams:
+                self._trigrams[trigram].append(key)
+
+    def __len__(self):
+        return len(self._names)
+
+    def lookup(self, name):
+        """Returns the indexed entry of a name
+
+        Args:
+            name (str): the name, case insensitive
+
+        Returns:
+            IndexedName or None: the entry or None if the name is not indexed
+        """
+        return self._names.get(name.lower())
+
+    def complete(self, prefix, limit=SUGGESTION_COUNT):
+        """Returns indexed names starting with a prefix, in alphabetical order
+
+        Args:
+            prefix (str): start of the name, case insensitive
+            limit (int, optional): max number of names to return
+
+        Returns:
+            List[IndexedName]: the matching entries
+        """
+        prefix = prefix.lower()
+        start = bisect_left(self._sorted, prefix)
+        matches = []
+
+        # Names sharing a prefix are next to each other once sorted
+        for key in self._sorted[start : start + limit]:
+            if not key.startswith(prefix):
+                break
+
+            matches.append(self._names[key])
+
+        return matches
+
+    def suggest(self, name, limit=SUGGESTION_COUNT, min_similarity=MIN_SIMILARITY):
+        """Returns the indexed names most similar to a name
+
+        Args:
+            name (str): the name, case insensitive
+            limit (int, optional): max number of names to return
+            min_similarity (float, optional): min share of trigrams in common
+
+        Returns:
+            List[IndexedName]: the most similar entries, most similar first
+        """
+        query = trigrams(name.lower())
+        shared = defaultdict(int)
+
+        for trigram in query:
+            for key in self._trigrams.get(trigram, ()):
+                shared[key] += 1
+
+        scored = []
+
+        for key, count in shared.items():
+            # Jaccard similarity of the two trigram sets
+            similarity = count / (len(query) + self._sizes[key] - count)
+
+            if similarity >= min_similarity:
+                scored.append((-similarity, not self._names[key].current, key))
+
+        return [self._names[key] for _, _, key in sorted(scored)[:limit]]
+
+
+def build_username_index(views, load_history=None):
+    """Indexes the usernames of every cached leaderboard and stored name history
+
+    Args:
+        views (dict): mapping of view name to columnar view data, as published in
+                      leaderboard snapshots
+        load_history (Callable, optional): returns stored names with uuid, name
+                                           and whether it is the player's current
+                                           name, only called once a snapshot exists
+
+    Returns:
+        UsernameIndex: the index
+    """
+    history = load_history() if views and load_history else ()
+    names = [
+        IndexedName(row["name"], row["uuid"], row["current"]) for row in history
+    ]
+
+    for data in views.values():
+        names.extend(
+            IndexedName(username, uuid, True)
+            for username, uuid in zip(data["username"], data["uuid"])
+        )
+
+    return UsernameIndex(names)
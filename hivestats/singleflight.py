@@ -0,0 +1,83 @@
+import asyncio
+
+LINGER = 1.0  # Seconds a finished result is shared with identical requests
+
+
+def make_key(*parts):
+    """Normalises command arguments into a key identifying identical requests
+
+    Args:
+        parts (Any): arguments of the request, strings are compared case and
+                     dash insensitively
+
+    Returns:
+        Tuple: the key
+    """
+    return tuple(
+        part.strip().lower().replace("-", "") if isinstance(part, str) else part
+        for part in parts
+    )
+
+
+class SingleFlight:
+    """Lets concurrent identical requests share a single computation and its result
+
+    Args:
+        linger (float, optional): seconds a successful result keeps being shared
+                                  after it finished, defaults to LINGER
+    """
+
+    def __init__(self, linger=LINGER):
+        self.linger = linger
+        self.hits = 0
+        self.misses = 0
+        self._calls = {}
+
+    @property
+    def in_flight(self):
+        """int: number of computations that have not finished yet"""
+        return sum(not call.done() for call in self._calls.values())
+
+    async def do(self, key, func, *args, **kwargs):
+        """Returns the result of func, joining an identical computation if one is
+        already running or finished within the linger time
+
+        Args:
+            key (Hashable): identifies identical requests, see make_key
+            func (Callable): function or coroutine function computing the result,
+                             results are shared so must not be mutated by callers
+            args, kwargs: passed to func
+
+        Returns:
+            Any: the result of func
+        """
+        call = self._calls.get(key)
+
+        if call is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            call = asyncio.ensure_future(self._run(func, *args, **kwargs))
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._finished(key, done))
+
+        # Shielded so one caller being cancelled does not cancel the others
+        return await asyncio.shield(call)
+
+    async def _run(self, func, *args, **kwargs):
+        result = func(*args, **kwargs)
+
+        if asyncio.iscoroutine(result):
+            result = await result
+
+        return result
+
+    def _finished(self, key, call):
+        def forget():
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+        if call.cancelled() or call.exception() is not None:
+            forget()
+        else:
+            asyncio.get_event_loop().call_later(self.linger, forget)
@@ -0,0 +1,261 @@
+import hashlib
+import os
+import struct
+import tempfile
+import zlib
+from os import path
+
+from .database.snapshot import private_directory
+from .metrics import compute_metrics
+
+SPARKLINE_DIR = os.environ.get(  # Only ever readable by the user running the bot
+    "SPARKLINE_DIR",
+    path.join(tempfile.gettempdir(), f"hivestats-sparklines-{os.getuid()}"),
+)
+CACHE_SIZE = 64 * 1024 * 1024  # Max bytes of charts kept on disk
+TREND_DAYS = 30  # Days of history shown in trend charts
+
+WIDTH, HEIGHT = 240, 48  # Size of a chart in pixels
+PADDING = 2  # Pixels kept free above and below the line
+PALETTE = (  # Background, area below the line and the line itself
+    (0x00, 0x00, 0x00),
+    (0xFF, 0xE4, 0xB3),
+    (0xFF, 0xA5, 0x00),
+)
+BACKGROUND, FILL, LINE = range(len(PALETTE))
+
+TREND_METRICS = (  # Charted metrics with the column they come from and whether
+    ("points", "total_points", False),  # lower values are better
+    ("position", "human_index", True),
+    ("win_rate", "win_rate", False),
+)
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def png_chunk(tag, data):
+    """Returns a png chunk with its length and checksum"""
+    checksum = zlib.crc32(tag + data) & 0xFFFFFFFF
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", checksum)
+
+
+def encode_png(rows, width, height, palette=PALETTE):
+    """Encodes a palette image as png, the first palette entry is transparent
+
+    Args:
+        rows (Iterable[bytearray]): palette index of every pixel, row by row
+        width (int): width of the image in pixels
+        height (int): height of the image in pixels
+        palette (Tuple[Tuple[int]], optional): rgb colors of the palette
+
+    Returns:
+        bytes: the png file
+    """
+    # Every row is prefixed with filter type 0, palette images compress well as is
+    raw = b"".join(b"\x00" + bytes(row) for row in rows)
+
+    return b"".join(
+        (
+            PNG_SIGNATURE,
+            png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)),
+            png_chunk(b"PLTE", bytes(value for color in palette for value in color)),
+            png_chunk(b"tRNS", b"\x00"),
+            png_chunk(b"IDAT", zlib.compress(raw, 9)),
+            png_chunk(b"IEND", b""),
+        )
+    )
+
+
+def render_sparkline(times, values, invert=False, width=WIDTH, height=HEIGHT):
+    """Renders values over time as a small line chart
+
+    Args:
+        times (Sequence[float]): increasing timestamps of the values
+        values (Sequence[float]): the values
+        invert (bool, optional): whether lower values are drawn higher up
+        width (int, optional): width of the chart in pixels
+        height (int, optional): height of the chart in pixels
+
+    Returns:
+        bytes or None: the chart as png or None if there are less than 2 values
+    """
+    if len(values) < 2 or times[-1] == times[0]:
+        return None
+
+    low, high = min(values), max(values)
+    span = (high - low) or 1
+    usable = height - 1 - 2 * PADDING
+    step = (times[-1] - times[0]) / (width - 1)
+
+    # Each column shows the value interpolated at its time
+    heights = []
+    point = 0
+
+    for x in range(width):
+        time = times[0] + x * step
+
+        while point < len(times) - 2 and times[point + 1] < time:
+            point += 1
+
+        start, end = times[point], times[point + 1]
+        weight = min(max((time - start) / ((end - start) or 1), 0), 1)
+        value = values[point] + (values[point + 1] - values[point]) * weight
+        scaled = (value - low) / span if invert else (high - value) / span
+        heights.append(PADDING + round(scaled * usable))
+
+    rows = [bytearray(width) for _ in range(height)]
+
+    for x, y in enumerate(heights):
+        for below in range(y + 1, height):
+            rows[below][x] = FILL
+
+        # Steep segments are joined up by drawing the whole vertical span
+        next_y = heights[x + 1] if x + 1 < width else y
+
+        for line_y in range(min(y, next_y), max(y, next_y) + 1):
+            rows[line_y][x] = LINE
+
+    return encode_png(rows, width, height)
+
+
+def render_trends(history):
+    """Renders the trend charts of every player
+
+    Args:
+        history (dict): mapping of uuid to columnar history arrays, holding the
+                        time of each snapshot in snapshot_at
+
+    Returns:
+        dict: mapping of uuid to a mapping of metric name to png
+    """
+    charts = {}
+
+    for uuid, columns in history.items():
+        columns = dict(columns, **compute_metrics(columns))
+        charts[uuid] = {}
+
+        for metric, column, invert in TREND_METRICS:
+            chart = render_sparkline(columns["snapshot_at"], columns[column], invert)
+
+            if chart is not None:
+                charts[uuid][metric] = chart
+
+    return charts
+
+
+class SparklineCache:
+    """Content addressed disk cache of charts, shared by every bot process on a
+    host, evicting the least recently used charts once it grows past max_size
+
+    Args:
+        directory (str, optional): directory charts are stored in
+        max_size (int, optional): max bytes of charts kept
+        window (int, optional): days of history shown in charts
+    """
+
+    def __init__(self, directory=SPARKLINE_DIR, max_size=CACHE_SIZE, window=TREND_DAYS):
+        self.directory = directory
+        self.max_size = max_size
+        self.window = window
+        private_directory(directory)
+        self._size = sum(entry.stat().st_size for entry in self._entries())
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.directory) if entry.is_file()]
+
+    def _path(self, uuid, metric, version):
+        key = f"{uuid}:{metric}:{self.window}:{version}".encode()
+        return path.join(self.directory, hashlib.sha1(key).hexdigest() + ".png")
+
+    def get(self, uuid, metric, version):
+        """Returns a cached chart
+
+        Args:
+            uuid (str): id of the player
+            metric (str): name of the charted metric
+            version (int): version of the data the chart was rendered from
+
+        Returns:
+            bytes or None: the chart or None if it is not cached
+        """
+        file_path = self._path(uuid, metric, version)
+
+        try:
+            with open(file_path, "rb") as file:
+                chart = file.read()
+        except FileNotFoundError:
+            return None
+
+        os.utime(file_path)  # Marks the chart as recently used
+        return chart
+
+    def put(self, uuid, metric, version, chart):
+        """Stores a chart, evicting old charts if the cache is full"""
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+
+        with os.fdopen(fd, "wb") as file:
+            file.write(chart)
+
+        os.replace(temp_path, self._path(uuid, metric, version))
+        self._size += len(chart)
+
+        if self._size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """Removes the least recently used charts until the cache fits in half of
+        max_size, so that eviction does not run on every put
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        self._size = sum(entry.stat().st_size for entry in entries)
+
+        for entry in entries:
+            if self._size <= self.max_size // 2:
+                break
+
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue  # Already evicted by another process
+
+            self._size -= size
+
+    def charts(self, uuid, version):
+        """Returns every cached chart of a player
+
+        Args:
+            uuid (str): id of the player
+            version (int): version of the data the charts were rendered from
+
+        Returns:
+            List[Tuple[str, bytes]]: name and png of every cached chart
+        """
+        charts = [
+            (metric, self.get(uuid, metric, version)) for metric, _, _ in TREND_METRICS
+        ]
+        return [(metric, chart) for metric, chart in charts if chart is not None]
+
+    def missing(self, uuids, version):
+        """Returns the players whose charts are not all cached
+
+        Args:
+            uuids (Iterable[str]): ids of the players
+            version (int): version of the data the charts are rendered from
+
+        Returns:
+            List[str]: ids of the players
+        """
+        return [
+            uuid
+            for uuid in uuids
+            if not all(
+                path.exists(self._path(uuid, metric, version))
+                for metric, _, _ in TREND_METRICS
+            )
+        ]
+
+    def store(self, charts, version):
+        """Stores charts rendered by render_trends"""
+        for uuid, player_charts in charts.items():
+            for metric, chart in player_charts.items():
+                self.put(uuid, metric, version, chart)
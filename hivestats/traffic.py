@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import time
+from itertools import count
+from threading import Lock
+
+TRAFFIC_LOG = os.environ.get("TRAFFIC_LOG")  # File traffic is recorded to, if set
+# Spawned shard processes are given the salt of the launcher in TRAFFIC_SALT, so ids
+# hash the same in every shard
+TRAFFIC_SALT = os.environ.get("TRAFFIC_SALT") or os.urandom(16).hex()
+
+
+def anonymise(discord_id, salt=TRAFFIC_SALT):
+    """Replaces a discord id with a salted hash that is still an int, so that
+    quotas keyed by user and guild behave the same when traffic is replayed
+
+    Args:
+        discord_id (int or None): id of a user, guild or channel
+        salt (str, optional): secret mixed into the hash
+
+    Returns:
+        int or None: the anonymised id
+    """
+    if discord_id is None:
+        return None
+
+    digest = hashlib.sha1(f"{salt}:{discord_id}".encode()).hexdigest()
+    return int(digest[:15], 16)
+
+
+class TrafficRecorder:
+    """Records command invocations and reactions as JSON lines so that they can
+    be replayed with hivestats.replay
+
+    Discord ids are anonymised, command arguments are kept as they are as they
+    only hold public Minecraft usernames and options.
+
+    Args:
+        path (str or None): file to append events to, nothing is recorded if None
+    """
+
+    def __init__(self, path=TRAFFIC_LOG):
+        self.path = path
+        self._ids = count()
+        self._lock = Lock()
+
+    def _write(self, event):
+        if not self.path:
+            return
+
+        event["at"] = time.time()
+        line = json.dumps(event, default=str) + "\n"
+
+        # Appends of single lines do not interleave between shard processes
+        with self._lock, open(self.path, "a") as file:
+            file.write(line)
+
+    def command(self, name, args, kwargs, guild_id, user_id, channel_id):
+        """Records a command invocation
+
+        Args:
+            name (str): qualified name of the command
+            args (List[Any]): converted positional arguments, without the context
+            kwargs (dict): converted keyword arguments
+            guild_id (int or None): id of the guild, None for DMs
+            user_id (int): id of the invoking user
+            channel_id (int): id of the channel
+
+        Returns:
+            str: id of the invocation, used to record its reactions
+        """
+        invocation = f"{os.getpid()}-{next(self._ids)}"
+        self._write(
+            {
+                "kind": "command",
+                "invocation": invocation,
+                "command": name,
+                "args": list(args),
+                "kwargs": kwargs,
+                "guild": anonymise(guild_id),
+                "user": anonymise(user_id),
+                "channel": anonymise(channel_id),
+            }
+        )
+
+        return invocation
+
+    def reaction(self, invocation, emoji):
+        """Records a reaction handled by a command's reaction interface
+
+        Args:
+            invocation (str): id of the invocation that sent the message
+            emoji (str): name of the emoji
+        """
+        self._write({"kind": "reaction", "invocation": invocation, "emoji": emoji})
+
+
+def read_events(path):
+    """Reads recorded events ordered by time
+
+    Args:
+        path (str): file events were recorded to
+
+    Returns:
+        List[dict]: the events
+    """
+    with open(path) as file:
+        events = [json.loads(line) for line in file if line.strip()]
+
+    return sorted(events, key=lambda event: event["at"])
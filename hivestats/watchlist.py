@@ -0,0 +1,186 @@
+from collections import defaultdict
+from typing import NamedTuple
+
+from .content_functions import get_rank
+
+TOP_POSITION = 100  # Position a player has to reach for the top rule
+MAX_MESSAGE_LENGTH = 2000  # Max length of a discord message
+
+
+class Subscription(NamedTuple):
+    channel_id: int
+    uuid: str
+    rule: str
+    threshold: int
+
+
+class Change(NamedTuple):
+    uuid: str
+    old: dict  # None if the player was not on the previous leaderboard
+    new: dict
+
+
+def escape(username):
+    """Escapes characters in a username that discord would treat as formatting"""
+    return username.replace("_", "\\_")
+
+
+def gained_positions(subscription, change):
+    """Fires when a player climbed at least threshold positions"""
+    if change.old is None:
+        return None
+
+    gained = change.old["position"] - change.new["position"]
+
+    if gained < max(subscription.threshold, 1):
+        return None
+
+    return "**{}** climbed {:,} positions to #{:,}".format(
+        escape(change.new["username"]), gained, change.new["position"]
+    )
+
+
+def reached_rank(subscription, change):
+    """Fires when a player reached a new rank"""
+    if change.old is None:
+        return None
+
+    rank = get_rank(change.new["total_points"])
+
+    if rank == get_rank(change.old["total_points"]):
+        return None
+
+    return "**{}** reached the {} rank".format(escape(change.new["username"]), rank)
+
+
+def entered_top(subscription, change):
+    """Fires when a player entered the top positions of the leaderboard"""
+    if change.new["position"] > TOP_POSITION:
+        return None
+
+    if change.old is not None and change.old["position"] <= TOP_POSITION:
+        return None
+
+    return "**{}** entered the top {} at #{:,}".format(
+        escape(change.new["username"]), TOP_POSITION, change.new["position"]
+    )
+
+
+RULES = {  # Mapping of user facing rule names to the functions evaluating them
+    "positions": gained_positions,
+    "rank": reached_rank,
+    "top": entered_top,
+}
+
+
+def diff_rows(old_rows, new_rows):
+    """Returns the players whose position or points changed between two snapshots
+
+    Args:
+        old_rows (Iterable[dict]): rows of the previous snapshot
+        new_rows (Iterable[dict]): rows of the new snapshot
+
+    Returns:
+        List[Change]: the changes
+    """
+    old_by_uuid = {row["uuid"]: row for row in old_rows}
+    changes = []
+
+    for row in new_rows:
+        old = old_by_uuid.get(row["uuid"])
+
+        if old is None or (
+            old["position"] != row["position"]
+            or old["total_points"] != row["total_points"]
+        ):
+            changes.append(Change(row["uuid"], old, row))
+
+    return changes
+
+
+def batch_messages(lines, limit=MAX_MESSAGE_LENGTH):
+    """Joins lines into as few messages as possible within the length limit"""
+    messages = []
+
+    for line in lines:
+        if messages and len(messages[-1]) + len(line) + 1 <= limit:
+            messages[-1] += "\n" + line
+        else:
+            messages.append(line)
+
+    return messages
+
+
+class Watchlist:
+    """In memory index from watched players to their subscriptions, used to
+    evaluate rules against only the players that changed in a refresh
+    """
+
+    def __init__(self, subscriptions=()):
+        self._by_uuid = defaultdict(dict)
+
+        for subscription in subscriptions:
+            self.add(subscription)
+
+    def __len__(self):
+        return sum(len(subscriptions) for subscriptions in self._by_uuid.values())
+
+    def add(self, subscription):
+        """Adds a subscription, replacing one for the same channel, player and
+        rule
+        """
+        key = (subscription.channel_id, subscription.rule)
+        self._by_uuid[subscription.uuid][key] = subscription
+
+    def remove(self, channel_id, uuid, rule=None):
+        """Removes the subscriptions of a channel to a player, optionally only the
+        one for a rule
+        """
+        subscriptions = self._by_uuid.get(uuid, {})
+
+        for key in list(subscriptions):
+            if key[0] == channel_id and rule in (None, key[1]):
+                del subscriptions[key]
+
+        if not subscriptions:
+            self._by_uuid.pop(uuid, None)
+
+    def channel(self, channel_id):
+        """Returns the subscriptions of a channel
+
+        Args:
+            channel_id (int): id of the channel
+
+        Returns:
+            List[Subscription]: the subscriptions
+        """
+        return [
+            subscription
+            for subscriptions in self._by_uuid.values()
+            for subscription in subscriptions.values()
+            if subscription.channel_id == channel_id
+        ]
+
+    def evaluate(self, changes):
+        """Evaluates the rules of subscriptions to players that changed
+
+        Args:
+            changes (Iterable[Change]): changes between two snapshots, see
+                                        diff_rows
+
+        Returns:
+            Dict[int, List[str]]: notification messages to send to each channel
+        """
+        lines = defaultdict(list)
+
+        for change in changes:
+            for subscription in self._by_uuid.get(change.uuid, {}).values():
+                line = RULES[subscription.rule](subscription, change)
+
+                if line is not None:
+                    lines[subscription.channel_id].append(line)
+
+        return {
+            channel_id: batch_messages(channel_lines)
+            for channel_id, channel_lines in lines.items()
+        }
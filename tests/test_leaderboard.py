@@ -0,0 +1,96 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+yaml = pytest.importorskip("yaml")
+
+from hivestats.database import leaderboard as db_lb  # noqa: E402
+
+
+class FakeCursor:
+    def execute(self, query, params=None):
+        pass
+
+
+class FakeDatabase:
+    """Records the rows inserted into each table"""
+
+    def __init__(self):
+        self.cursor = FakeCursor()
+        self.inserted = {}
+
+    def insert(self, table, columns, values, *, conflict_key=None):
+        self.inserted[table] = [dict(zip(columns, row)) for row in values]
+
+
+def hive_entry(index, uuid, username, victories, points, placing, played):
+    """Returns an entry shaped like those of the Hive leaderboard api"""
+    return {
+        "index": index,
+        "human_index": index + 1,
+        "UUID": uuid,
+        "victories": victories,
+        "total_points": points,
+        "total_eliminations": played - victories,
+        "total_placing": placing,
+        "games_played": played,
+        "username": username,
+    }
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    with open(db_lb.TABLE_FILE) as file:
+        tables = {
+            name: db_lb.Table(**table) for name, table in yaml.safe_load(file).items()
+        }
+
+    monkeypatch.setattr(db_lb, "TABLES", tables, raising=False)
+    monkeypatch.setattr(db_lb, "LAST_UPDATED", tables["last_updated"], raising=False)
+    monkeypatch.setattr(db_lb, "record_history", lambda *args: None)
+    monkeypatch.setattr(db_lb, "publish_snapshot", lambda *args: None)
+
+    return tables
+
+
+def test_update_stores_hive_entries(monkeypatch, tables):
+    entries = [
+        hive_entry(0, "a", "First", 50, 9000, 120, 200),
+        hive_entry(1, "b", "Second", 0, 10, 0, 0),
+    ]
+    monkeypatch.setattr(
+        db_lb, "leaderboard", lambda game, start, length: entries if not start else []
+    )
+    database = FakeDatabase()
+
+    db_lb.update_leaderborad(database, tables["bp_all"])
+
+    assert database.inserted["bp_all"] == [
+        {
+            "index": 0,
+            "human_index": 1,
+            "uuid": "a",
+            "victories": 50,
+            "total_points": 9000,
+            "total_eliminations": 150,
+            "total_placing": 120,
+            "games_played": 200,
+            "username": "First",
+            "win_rate": 0.25,
+            "placing_rate": 0.6,
+            "points_per_game": 45.0,
+        },
+        {
+            "index": 1,
+            "human_index": 2,
+            "uuid": "b",
+            "victories": 0,
+            "total_points": 10,
+            "total_eliminations": 0,
+            "total_placing": 0,
+            "games_played": 0,
+            "username": "Second",
+            "win_rate": 0.0,
+            "placing_rate": 0.0,
+            "points_per_game": 0.0,
+        },
+    ]
@@ -0,0 +1,80 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from hivestats.database import leaderboard as db_lb  # noqa: E402
+from hivestats.database.snapshot import to_rows  # noqa: E402
+from hivestats.watchlist import Subscription, Watchlist, diff_rows  # noqa: E402
+
+
+class FakeCursor:
+    """Answers the queries of load_snapshot with the same players for every view"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeDatabase:
+    def __init__(self, rows):
+        self.cursor = FakeCursor(rows)
+
+
+def player(position, uuid, points, username):
+    return {
+        "position": position,
+        "uuid": uuid,
+        "victories": 10,
+        "total_points": points,
+        "total_eliminations": 5,
+        "total_placing": 20,
+        "games_played": 40,
+        "username": username,
+        "win_rate": 0.25,
+        "placing_rate": 0.5,
+        "points_per_game": points / 40,
+    }
+
+
+def snapshot_rows(players):
+    snapshot = db_lb.load_snapshot(FakeDatabase(players))
+    return to_rows(snapshot["bp_all_view"])
+
+
+def test_diff_rows_on_snapshot_rows():
+    old = snapshot_rows(
+        [player(100, "a", 5000, "Climber"), player(101, "b", 4990, "Steady")]
+    )
+    new = snapshot_rows(
+        [player(90, "a", 6000, "Climber"), player(101, "b", 4990, "Steady")]
+    )
+
+    assert diff_rows(old, old) == []
+
+    changes = diff_rows(old, new)
+
+    assert [change.uuid for change in changes] == ["a"]
+    assert changes[0].old["position"] == 100
+    assert changes[0].new["position"] == 90
+
+
+def test_rules_on_snapshot_rows():
+    old = snapshot_rows([player(105, "a", 5000, "Climber")])
+    new = snapshot_rows([player(95, "a", 5000, "Climber")])
+    watchlist = Watchlist(
+        [Subscription(1, "a", "positions", 5), Subscription(1, "a", "top", 0)]
+    )
+
+    messages = watchlist.evaluate(diff_rows(old, new))
+
+    assert messages == {
+        1: [
+            "**Climber** climbed 10 positions to #95\n"
+            "**Climber** entered the top 100 at #95"
+        ]
+    }